@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import voyageai.error
+
+# Failures worth retrying: throttling, server-side errors and dropped connections.
+RETRYABLE_ERRORS = (
+    voyageai.error.RateLimitError,
+    voyageai.error.ServiceUnavailableError,
+    voyageai.error.ServerError,
+    voyageai.error.APIConnectionError,
+    voyageai.error.Timeout,
+    voyageai.error.TryAgain,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+def _is_retryable(error):
+    status = getattr(error, "http_status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available (a request larger than capacity drains it)."""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+class EmbeddingPipeline:
+    """Embeds texts in batches with several requests in flight at once.
+
+    At most `max_in_flight` batches are outstanding; new batches are only submitted
+    as earlier ones finish, so memory stays bounded for any corpus size. Requests are
+    paced by optional per-minute request and token budgets (tokens estimated as
+    characters / 4), and batches failing with 429, 5xx or connection errors are
+    retried with full-jitter exponential backoff, honouring any Retry-After header.
+
+    `on_batch(texts, embeddings)` is called, in the calling thread, as each batch
+    completes, so the caller can checkpoint finished work (EmbeddingCache stores it,
+    which makes an interrupted run resume where it stopped).
+    """
+
+    def __init__(
+        self,
+        batch_size=128,
+        max_in_flight=4,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=6,
+        base_delay=1.0,
+        max_delay=60.0,
+    ):
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._requests = TokenBucket(requests_per_minute / 60) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute / 60) if tokens_per_minute else None
+
+    def embed(self, embedder, texts, on_batch=None):
+        """Embed `texts` with `embedder` (see embedders.py) and return them in input order."""
+        batches = [texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending = {}
+            for i, batch in enumerate(batches):
+                if len(pending) >= self.max_in_flight:
+                    self._collect(pending, results, batches, on_batch, FIRST_COMPLETED)
+                pending[executor.submit(self._embed_batch, embedder, batch)] = i
+            self._collect(pending, results, batches, on_batch)
+        return [embedding for batch in results for embedding in batch]
+
+    @staticmethod
+    def _collect(pending, results, batches, on_batch, return_when="ALL_COMPLETED"):
+        errors = []
+        while pending:
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                i = pending.pop(future)
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                results[i] = future.result()
+                if on_batch is not None:
+                    on_batch(batches[i], results[i])
+            if not errors:
+                break
+            # After a failure nothing new is submitted; the batches still in flight
+            # finish and are handed over too.
+            return_when = "ALL_COMPLETED"
+        if errors:
+            # Raised only after every finished batch has been handed to on_batch.
+            raise errors[0]
+
+    def _embed_batch(self, embedder, batch):
+        for attempt in range(self.max_retries + 1):
+            if self._requests is not None:
+                self._requests.acquire()
+            if self._tokens is not None:
+                self._tokens.acquire(sum(len(text) for text in batch) / 4)
+            try:
+                return embedder.embed(batch)
+            except Exception as error:
+                if attempt == self.max_retries or not _is_retryable(error):
+                    raise
+                time.sleep(self._backoff(attempt, error))
+
+    def _backoff(self, attempt, error):
+        retry_after = (getattr(error, "headers", None) or {}).get("retry-after")
+        try:
+            return min(self.max_delay, float(retry_after))
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
@@ -0,0 +1,331 @@
+"""Compressed-vector indexes for VectorDB.
+
+These follow the same build/add/search/save/load interface as the indexes in
+indexes.py. They keep only compact codes in memory and score queries against the
+codes directly (asymmetric distance computation: the query stays full precision).
+With `rescore_factor` set, the best `k * rescore_factor` candidates are re-scored
+exactly against the full-precision (memory-mapped) embeddings before the top-k
+is returned.
+"""
+
+import numpy as np
+from indexes import _cluster_sums, _save_npz, _top_k
+
+
+def _rescore(embeddings, query, approx_scores, k, rescore_factor, rows=None):
+    """Top-k (ids, scores) from approximate scores, optionally re-scored exactly.
+
+    With `rows` (sorted row ids), only those rows are candidates.
+    """
+    candidates = approx_scores if rows is None else approx_scores[rows]
+    if not rescore_factor:
+        top = _top_k(candidates, k)
+        return (top if rows is None else rows[top]), candidates[top]
+    shortlist = np.sort(_top_k(candidates, k * rescore_factor))
+    if rows is not None:
+        shortlist = rows[shortlist]
+    exact_scores = embeddings[shortlist] @ query
+    top = _top_k(exact_scores, k)
+    return shortlist[top], exact_scores[top]
+
+
+def _kmeans(vectors, n_clusters, n_iter, rng):
+    """Euclidean k-means; returns the (n_clusters, dim) centroids."""
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        distances = (
+            (vectors**2).sum(axis=1, keepdims=True)
+            - 2 * vectors @ centroids.T
+            + (centroids**2).sum(axis=1)
+        )
+        labels = np.argmin(distances, axis=1)
+        sums, counts = _cluster_sums(vectors, labels, n_clusters)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class ScalarQuantizedIndex:
+    """int8 scalar quantization with one symmetric scale per dimension (4x smaller than float32)."""
+
+    name = "sq8"
+
+    def __init__(self, rescore_factor=4, block_size=65_536):
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+        self.scales = None
+        self.codes = np.empty((0, 0), dtype=np.int8)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def build(self, embeddings):
+        max_abs = np.zeros(embeddings.shape[1], dtype=np.float32)
+        for i in range(0, len(embeddings), self.block_size):
+            block_max = np.abs(embeddings[i : i + self.block_size]).max(axis=0)
+            max_abs = np.maximum(max_abs, block_max)
+        max_abs[max_abs == 0] = 1.0
+        self.scales = (max_abs / 127).astype(np.float32)
+        self.codes = self._encode(embeddings)
+
+    def add(self, embeddings, start):
+        if self.scales is None:
+            self.build(embeddings)
+            return
+        self.codes = np.concatenate([self.codes[:start], self._encode(embeddings[start:])])
+
+    def _encode(self, embeddings):
+        blocks = [
+            np.clip(np.rint(embeddings[i : i + self.block_size] / self.scales), -127, 127)
+            for i in range(0, len(embeddings), self.block_size)
+        ]
+        return np.concatenate(blocks).astype(np.int8) if blocks else self.codes[:0]
+
+    def search(self, embeddings, queries, k, rescore_factor=None, mask=None):
+        rescore_factor = self.rescore_factor if rescore_factor is None else rescore_factor
+        rows = None if mask is None else np.flatnonzero(mask)
+        # codes * scales approximates the rows, so fold the scales into the queries once.
+        scaled_queries = (queries * self.scales).T
+        approx_scores = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        for i in range(0, len(self.codes), self.block_size):
+            block = self.codes[i : i + self.block_size].astype(np.float32)
+            approx_scores[:, i : i + self.block_size] = (block @ scaled_queries).T
+        return [
+            _rescore(embeddings, query, scores, k, rescore_factor, rows)
+            for query, scores in zip(queries, approx_scores)
+        ]
+
+    def save(self, path):
+        _save_npz(path, scales=self.scales, codes=self.codes)
+
+    def load(self, path):
+        data = np.load(path)
+        self.scales = data["scales"]
+        self.codes = data["codes"]
+
+
+class PQIndex:
+    """Product quantization: each vector is stored as one byte per subvector.
+
+    The embedding is split into `n_subvectors` slices (default: one per 8 dimensions,
+    32x smaller than float32), each replaced by the id of its nearest centroid in a
+    256-entry per-slice codebook. A query builds one (n_subvectors, 256) lookup table
+    of inner products and scores every row by summing table entries, never touching
+    the original vectors.
+    """
+
+    name = "pq"
+
+    def __init__(self, n_subvectors=None, rescore_factor=8, n_iter=15, train_size=16_384, seed=0):
+        self.n_subvectors = n_subvectors
+        self.rescore_factor = rescore_factor
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.seed = seed
+        self.codebooks = None  # (n_subvectors, 256, subvector dim)
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _split(self, vectors):
+        return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.n_subvectors, -1)
+
+    def build(self, embeddings):
+        self.n_subvectors = self.n_subvectors or max(1, embeddings.shape[1] // 8)
+        if embeddings.shape[1] % self.n_subvectors:
+            raise ValueError(
+                f"Embedding dimension {embeddings.shape[1]} is not divisible by "
+                f"n_subvectors={self.n_subvectors}."
+            )
+        rng = np.random.default_rng(self.seed)
+        n_train = min(len(embeddings), self.train_size)
+        sample = self._split(
+            embeddings[np.sort(rng.choice(len(embeddings), n_train, replace=False))]
+        )
+        n_centroids = min(256, n_train)
+        self.codebooks = np.stack(
+            [_kmeans(sample[:, m], n_centroids, self.n_iter, rng) for m in range(self.n_subvectors)]
+        )
+        self.codes = self._encode(embeddings)
+
+    def add(self, embeddings, start):
+        if self.codebooks is None:
+            self.build(embeddings)
+            return
+        self.codes = np.concatenate([self.codes[:start], self._encode(embeddings[start:])])
+
+    def _encode(self, embeddings, block_size=65_536):
+        codes = np.empty((len(embeddings), self.n_subvectors), dtype=np.uint8)
+        for i in range(0, len(embeddings), block_size):
+            block = self._split(embeddings[i : i + block_size])
+            for m, codebook in enumerate(self.codebooks):
+                distances = -2 * block[:, m] @ codebook.T + (codebook**2).sum(axis=1)
+                codes[i : i + block_size, m] = np.argmin(distances, axis=1)
+        return codes
+
+    def search(self, embeddings, queries, k, rescore_factor=None, mask=None):
+        rescore_factor = self.rescore_factor if rescore_factor is None else rescore_factor
+        rows = None if mask is None else np.flatnonzero(mask)
+        subspaces = np.arange(self.n_subvectors)
+        results = []
+        for query in queries:
+            lookup = np.einsum("md,mcd->mc", self._split(query[None])[0], self.codebooks)
+            approx_scores = lookup[subspaces, self.codes].sum(axis=1)
+            results.append(_rescore(embeddings, query, approx_scores, k, rescore_factor, rows))
+        return results
+
+    def save(self, path):
+        _save_npz(path, codebooks=self.codebooks, codes=self.codes)
+
+    def load(self, path):
+        data = np.load(path)
+        self.codebooks = data["codebooks"]
+        self.codes = data["codes"]
+        self.n_subvectors = len(self.codebooks)
+
+
+class BinaryIndex:
+    """Sign-bit codes scanned by Hamming distance, then re-scored at full precision.
+
+    Each dimension is reduced to its sign bit relative to the corpus mean (so bits
+    still split rows that share a dominant direction) and packed eight to a byte,
+    32x less memory bandwidth than float32. A query's Hamming distance to every row is an
+    XOR plus popcount; only the `k * rescore_factor` nearest rows are re-scored
+    against the float embeddings, so the returned similarities are exact.
+
+    Queries are coded by their own signs, not relative to the corpus mean: the ranking
+    follows (x - mean) . q, and queries (short questions against long chunks) need not
+    share the corpus's distribution. Dimensions where the query is exactly zero, common
+    for sparse query vectors, are masked out of the distance rather than counted as
+    negative.
+    """
+
+    name = "binary"
+
+    def __init__(self, rescore_factor=10, block_size=65_536):
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+        self.mean = None
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def build(self, embeddings):
+        self.mean = np.zeros(embeddings.shape[1], dtype=np.float32)
+        for i in range(0, len(embeddings), self.block_size):
+            self.mean += embeddings[i : i + self.block_size].sum(axis=0)
+        self.mean /= max(1, len(embeddings))
+        self.codes = self._encode(embeddings)
+
+    def add(self, embeddings, start):
+        if self.mean is None:
+            self.build(embeddings)
+            return
+        self.codes = np.concatenate([self.codes[:start], self._encode(embeddings[start:])])
+
+    def _encode(self, embeddings):
+        blocks = [
+            np.packbits(embeddings[i : i + self.block_size] > self.mean, axis=1)
+            for i in range(0, len(embeddings), self.block_size)
+        ]
+        return np.concatenate(blocks) if blocks else self.codes[:0]
+
+    def search(self, embeddings, queries, k, rescore_factor=None, mask=None):
+        rescore_factor = max(1, rescore_factor or self.rescore_factor)
+        rows = None if mask is None else np.flatnonzero(mask)
+        results = []
+        query_codes = np.packbits(queries > 0, axis=1)
+        query_masks = np.packbits(queries != 0, axis=1)
+        for query, query_code, query_mask in zip(queries, query_codes, query_masks):
+            differing = (self.codes ^ query_code) & query_mask
+            distances = np.bitwise_count(differing).sum(axis=1, dtype=np.int32)
+            # Fewer differing bits is better, so rank the negated distances.
+            results.append(_rescore(embeddings, query, -distances, k, rescore_factor, rows))
+        return results
+
+    def save(self, path):
+        _save_npz(path, mean=self.mean, codes=self.codes)
+
+    def load(self, path):
+        data = np.load(path)
+        self.mean = data["mean"]
+        self.codes = data["codes"]
+
+
+class ProjectionIndex:
+    """Low-dimensional projections scanned first, then a shortlist re-scored in full.
+
+    Every row is kept as its `dims`-dimensional projection, either onto the top
+    principal components of the corpus (fitted once at build time with an SVD of up
+    to `sample_size` rows) or, with `method="prefix"`, its first `dims` coordinates,
+    which is what Matryoshka-trained embeddings are designed for. The first pass costs
+    dims / dim of a full scan; the best `k * rescore_factor` rows are then re-scored
+    against the full embeddings, so the returned similarities are exact.
+    """
+
+    name = "projection"
+
+    def __init__(self, dims=128, method="pca", rescore_factor=10, sample_size=20_000, seed=0):
+        if method not in ("pca", "prefix"):
+            raise ValueError(f"Unknown projection method {method!r}.")
+        self.dims = dims
+        self.method = method
+        self.rescore_factor = rescore_factor
+        self.sample_size = sample_size
+        self.seed = seed
+        self.mean = None
+        self.components = None  # (dims, dim) orthonormal rows
+        self.codes = np.empty((0, 0), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def build(self, embeddings):
+        dim = embeddings.shape[1]
+        dims = min(self.dims, dim)
+        if self.method == "prefix":
+            self.mean = np.zeros(dim, dtype=np.float32)
+            self.components = np.eye(dims, dim, dtype=np.float32)
+        else:
+            rng = np.random.default_rng(self.seed)
+            rows = np.sort(
+                rng.choice(len(embeddings), min(len(embeddings), self.sample_size), replace=False)
+            )
+            sample = np.asarray(embeddings[rows], dtype=np.float32)
+            self.mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+            self.components = np.ascontiguousarray(vt[:dims], dtype=np.float32)
+        self.codes = self._encode(embeddings)
+
+    def add(self, embeddings, start):
+        if self.components is None:
+            self.build(embeddings)
+            return
+        self.codes = np.concatenate([self.codes[:start], self._encode(embeddings[start:])])
+
+    def _encode(self, embeddings):
+        return np.ascontiguousarray((embeddings - self.mean) @ self.components.T, dtype=np.float32)
+
+    def search(self, embeddings, queries, k, rescore_factor=None, mask=None):
+        rescore_factor = max(1, rescore_factor or self.rescore_factor)
+        rows = None if mask is None else np.flatnonzero(mask)
+        # x . q = (x - mean) . q + mean . q; the second term is the same for every row,
+        # so ranking the projected first term is enough for the shortlist.
+        results = []
+        for start in range(0, len(queries), 64):  # bounds the (rows x queries) score block
+            block = queries[start : start + 64]
+            approx = self.codes @ (block @ self.components.T).T
+            for i, query in enumerate(block):
+                results.append(_rescore(embeddings, query, approx[:, i], k, rescore_factor, rows))
+        return results
+
+    def save(self, path):
+        _save_npz(path, mean=self.mean, components=self.components, codes=self.codes)
+
+    def load(self, path):
+        data = np.load(path)
+        self.mean = data["mean"]
+        self.components = data["components"]
+        self.codes = data["codes"]
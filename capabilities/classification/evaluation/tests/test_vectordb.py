@@ -0,0 +1,146 @@
+"""
+Unit tests for the classification VectorDB, built offline with HashingEmbedder.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from embedders import HashingEmbedder
+from embedding_cache import EmbeddingCache
+from indexes import IVFIndex
+from quantization import BinaryIndex, ProjectionIndex, ScalarQuantizedIndex
+from vectordb import VectorDB
+
+LABELS = ["Billing Inquiries", "Policy Administration", "Claims Assistance", "Coverage"]
+TOPICS = ["my invoice", "renewing my policy", "a car accident claim", "flood damage"]
+
+
+def make_items(n):
+    return [
+        {
+            "text": f"Question {i} about {TOPICS[i % len(TOPICS)]}, case number {i * 37}.",
+            "label": LABELS[i % len(LABELS)],
+        }
+        for i in range(n)
+    ]
+
+
+class CountingEmbedder(HashingEmbedder):
+    """HashingEmbedder that counts the texts it embeds."""
+
+    def __init__(self, dim=128):
+        super().__init__(dim=dim)
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+class TestVectorDB(unittest.TestCase):
+    """Test suite for loading, persistence, filtered search and indexes."""
+
+    def setUp(self):
+        """Run each test in a temporary work/ directory; the store lives in ../data."""
+        self.cwd = os.getcwd()
+        self.test_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.test_dir, "work"))
+        os.makedirs(os.path.join(self.test_dir, "data"))
+        os.chdir(os.path.join(self.test_dir, "work"))
+        self.cache = EmbeddingCache(os.path.join(self.test_dir, "embeddings.sqlite3"))
+        self.items = make_items(80)
+        self.dbs = []
+
+    def tearDown(self):
+        for db in self.dbs:
+            db.query_cache.flush()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.test_dir)
+
+    def make_db(self, **kwargs):
+        kwargs.setdefault("embedder", HashingEmbedder(dim=128))
+        db = VectorDB(embedding_cache=self.cache, **kwargs)
+        self.dbs.append(db)
+        return db
+
+    def test_load_data_then_load_db_round_trip(self):
+        """Test that a reopened store has the same rows and answers, embedding nothing."""
+        db = self.make_db()
+        db.load_data(self.items)
+        query = self.items[5]["text"]
+        expected = db.search(query, k=3, similarity_threshold=-1.0)
+        self.assertEqual(expected[0]["metadata"], self.items[5])
+        db.query_cache.flush()
+
+        embedder = CountingEmbedder()
+        reopened = self.make_db(embedder=embedder)
+        reopened.load_data(self.items)  # finds the saved store and loads it instead
+        np.testing.assert_array_equal(reopened.embeddings, db.embeddings)
+        self.assertEqual(reopened.metadata, self.items)
+        self.assertEqual(reopened.search(query, k=3, similarity_threshold=-1.0), expected)
+        self.assertEqual(embedder.embedded, 0)  # the query embedding came from its log
+
+    def test_reload_with_other_embedder_raises(self):
+        """Test that a store embedded with one model refuses to load with another."""
+        self.make_db().load_data(self.items)
+        with self.assertRaises(ValueError):
+            self.make_db(embedder=HashingEmbedder(dim=64)).load_db()
+
+    def test_where_restricts_results_to_a_label(self):
+        """Test that label filters return only matching rows, best first."""
+        db = self.make_db()
+        db.load_data(self.items)
+        query = self.items[6]["text"]
+        results = db.search(query, k=5, similarity_threshold=-1.0, where={"label": LABELS[1]})
+        self.assertEqual({r["metadata"]["label"] for r in results}, {LABELS[1]})
+        self.assertEqual(len(results), 5)
+        results = db.search(
+            query, k=10, similarity_threshold=-1.0, where={"label": [LABELS[0], LABELS[2]]}
+        )
+        self.assertEqual(results[0]["metadata"], self.items[6])
+        self.assertLessEqual({r["metadata"]["label"] for r in results}, {LABELS[0], LABELS[2]})
+        similarities = [r["similarity"] for r in results]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+
+    def assertSameHits(self, results, expected):
+        self.assertEqual(
+            [[r["metadata"] for r in hits] for hits in results],
+            [[r["metadata"] for r in hits] for hits in expected],
+        )
+        for hits, expected_hits in zip(results, expected):
+            for hit, expected_hit in zip(hits, expected_hits):
+                self.assertAlmostEqual(hit["similarity"], expected_hit["similarity"], places=5)
+
+    def test_indexes_match_the_exact_scan(self):
+        """Test that each index finds the exact scan's top hit and is saved for reopening."""
+        exact = self.make_db()
+        exact.load_data(self.items)
+        queries = [item["text"] for item in self.items[::8]]
+        expected = exact.search_batch(queries, k=1, similarity_threshold=-1.0)
+        for make_index in [
+            lambda: IVFIndex(nprobe=64),
+            ScalarQuantizedIndex,
+            BinaryIndex,
+            lambda: ProjectionIndex(dims=32),
+        ]:
+            index = make_index()
+            with self.subTest(index=index.name):
+                shutil.rmtree("../data")
+                os.makedirs("../data")
+                db = self.make_db(index=index)
+                db.load_data(self.items)
+                results = db.search_batch(queries, k=1, similarity_threshold=-1.0)
+                self.assertSameHits(results, expected)
+                self.assertTrue(os.path.exists(db.index_path))
+                reopened = self.make_db(index=make_index())
+                reopened.load_db()
+                self.assertEqual(len(reopened.index), len(self.items))
+                results = reopened.search_batch(queries, k=1, similarity_threshold=-1.0)
+                self.assertSameHits(results, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,75 +1,235 @@
+import json
 import os
-import numpy as np
-import voyageai
 import pickle
-import json
+
+import numpy as np
+from bitmap_index import BitmapIndex
+from embedders import VoyageEmbedder
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline
+from query_cache import QueryCache
+
+
+def _to_matrix(embeddings):
+    """Stack embeddings into one contiguous float32 matrix with unit-length rows."""
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+    if matrix.size == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def _top_k(similarities, k, similarity_threshold):
+    """Indices of the k highest similarities at or above the threshold, best first."""
+    candidates = np.flatnonzero(similarities >= similarity_threshold)
+    if k <= 0:
+        return candidates[:0]
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(similarities[candidates], -k)[-k:]]
+    return candidates[np.argsort(-similarities[candidates], kind="stable")]
+
+
+def _save_matrix(path, matrix):
+    """Write a float32 matrix as a raw .npy file, atomically replacing any existing copy."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.save(file, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def _load_matrix(path):
+    """Open a .npy matrix read-only through np.memmap so processes share the page cache."""
+    matrix = np.load(path, mmap_mode="r")
+    if matrix.dtype != np.float32 or matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D float32 matrix in {path}, got {matrix.dtype}.")
+    return matrix
 
 
 class VectorDB:
-    def __init__(self, api_key=None):
-        if api_key is None:
-            api_key = os.getenv("VOYAGE_API_KEY")
-        self.client = voyageai.Client(api_key=api_key)
-        self.embeddings = []
+    filter_fields = ("label",)  # fields search(where=...) can filter on
+
+    def __init__(
+        self,
+        api_key=None,
+        query_cache_size=10_000,
+        query_cache_bytes=None,
+        query_cache_ttl=None,
+        index=None,
+        embedding_cache=None,
+        embedding_pipeline=None,
+        embedder=None,
+    ):
+        # Any embedder from embedders.py; Voyage (keyed by api_key) unless one is given.
+        self.embedder = VoyageEmbedder(api_key=api_key) if embedder is None else embedder
+        # Shared with every other store, so a text is only ever embedded once per model.
+        self.embedding_cache = EmbeddingCache() if embedding_cache is None else embedding_cache
+        # Concurrency, rate limits and retries for the API calls the cache cannot answer.
+        self.embedding_pipeline = embedding_pipeline or EmbeddingPipeline()
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
         self.metadata = []
-        self.query_cache = {}
+        self.filters = BitmapIndex(self.filter_fields)
         self.db_path = "../data/vector_db.pkl"
+        # Bounded by entry count, bytes and/or age so long-running services don't grow forever.
+        self.query_cache = QueryCache(
+            self.query_cache_path,
+            max_entries=query_cache_size,
+            max_bytes=query_cache_bytes,
+            ttl=query_cache_ttl,
+        )
+        # Optional approximate index (see indexes.py and quantization.py); None means an
+        # exact scan.
+        self.index = index
+
+    @property
+    def embeddings_path(self):
+        return os.path.splitext(self.db_path)[0] + ".npy"
+
+    @property
+    def metadata_path(self):
+        return os.path.splitext(self.db_path)[0] + ".json"
+
+    @property
+    def query_cache_path(self):
+        return os.path.splitext(self.db_path)[0] + "_query_cache.jsonl"
+
+    @property
+    def index_path(self):
+        return os.path.splitext(self.db_path)[0] + f".{self.index.name}.npz"
 
     def load_data(self, data):
         # Check if the vector database is already loaded
-        if self.embeddings and self.metadata:
+        if len(self.embeddings) and self.metadata:
             print("Vector database is already loaded. Skipping data loading.")
             return
-        # Check if vector_db.pkl exists
-        if os.path.exists(self.db_path):
+        # Check if a saved database (or a legacy vector_db.pkl) exists
+        if os.path.exists(self.embeddings_path) or os.path.exists(self.db_path):
             print("Loading vector database from disk.")
             self.load_db()
             return
 
         texts = [item["text"] for item in data]
 
-        # Embed more than 128 documents with a for loop
-        batch_size = 128
-        result = [
-            self.client.embed(texts[i : i + batch_size], model="voyage-2").embeddings
-            for i in range(0, len(texts), batch_size)
-        ]
-
-        # Flatten the embeddings
-        self.embeddings = [embedding for batch in result for embedding in batch]
+        # Only texts never embedded before (by any store) are sent to the API
+        self.embeddings = _to_matrix(
+            self.embedding_cache.embed(self.embedder, texts, pipeline=self.embedding_pipeline)
+        )
         self.metadata = [item for item in data]
+        self.filters.build(self.metadata)
         # Save the vector database to disk
+        self.save_db()
+        self._sync_index()
         print("Vector database loaded and saved.")
 
-    def search(self, query, k=5, similarity_threshold=0.85):
-        query_embedding = None
-        if query in self.query_cache:
-            query_embedding = self.query_cache[query]
-        else:
-            query_embedding = self.client.embed([query], model="voyage-2").embeddings[0]
-            self.query_cache[query] = query_embedding
+    def _embed_queries(self, queries):
+        embeddings = {}
+        for query in dict.fromkeys(queries):
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                embeddings[query] = cached
+        missing = [query for query in dict.fromkeys(queries) if query not in embeddings]
+        for query, embedding in zip(
+            missing,
+            self.embedding_cache.embed(self.embedder, missing, pipeline=self.embedding_pipeline),
+        ):
+            self.query_cache[query] = embedding
+            embeddings[query] = embedding
+        return _to_matrix([embeddings[query] for query in queries])
+
+    def search(self, query, k=5, similarity_threshold=0.85, where=None):
+        return self.search_batch(
+            [query], k=k, similarity_threshold=similarity_threshold, where=where
+        )[0]
+
+    def search_batch(self, queries, k=5, similarity_threshold=0.85, where=None):
+        """Search for many queries at once and return one result list per query.
 
-        if not self.embeddings:
+        Uncached queries are embedded together and scored with a single matrix-matrix
+        product per block of queries rather than one matrix-vector product each.
+        `where` (e.g. {"label": "Billing Inquiries"}) restricts the search to matching
+        rows; see BitmapIndex.mask for the syntax.
+        """
+        if not len(self.embeddings):
             raise ValueError("No data loaded in the vector database.")
 
-        similarities = np.dot(self.embeddings, query_embedding)
-        top_indices = np.argsort(similarities)[::-1]
-        top_examples = []
+        return [
+            [
+                {"metadata": self.metadata[idx], "similarity": float(score)}
+                for idx, score in zip(ids, scores)
+            ]
+            for ids, scores in self._hits(
+                self._embed_queries(queries), k, similarity_threshold, where
+            )
+        ]
+
+    def _hits(self, query_embeddings, k, similarity_threshold, where=None):
+        """Yield (row ids, similarities) of each query's top-k rows above the threshold."""
+        block_size = 256  # bounds the (queries x corpus) similarity block held in memory
+        if where:
+            # Filter first, then score only the matching rows.
+            rows = np.flatnonzero(self.filters.mask(where))
+            matrix = self.embeddings[rows]
+            for start in range(0, len(query_embeddings), block_size):
+                for similarities in query_embeddings[start : start + block_size] @ matrix.T:
+                    top = _top_k(similarities, k, similarity_threshold)
+                    yield rows[top], similarities[top]
+            return
+
+        if self.index is not None:
+            for ids, scores in self.index.search(self.embeddings, query_embeddings, k):
+                keep = scores >= similarity_threshold
+                yield ids[keep], scores[keep]
+            return
 
-        for idx in top_indices:
-            if similarities[idx] >= similarity_threshold:
-                example = {
-                    "metadata": self.metadata[idx],
-                    "similarity": similarities[idx],
-                }
-                top_examples.append(example)
+        for start in range(0, len(query_embeddings), block_size):
+            similarities = query_embeddings[start : start + block_size] @ self.embeddings.T
+            for row in similarities:
+                top = _top_k(row, k, similarity_threshold)
+                yield top, row[top]
 
-                if len(top_examples) >= k:
-                    break
+    def _sync_index(self):
+        """Load the saved index and bring it up to date with the embedding matrix."""
+        if self.index is None:
+            return
+        if not len(self.index) and os.path.exists(self.index_path):
+            self.index.load(self.index_path)
+        if len(self.index) == len(self.embeddings):
+            return
+        if len(self.index) > len(self.embeddings):
+            self.index.build(self.embeddings)
+        else:
+            self.index.add(self.embeddings, len(self.index))
+        self.index.save(self.index_path)
 
-        return top_examples
+    def save_db(self):
+        _save_matrix(self.embeddings_path, self.embeddings)
+        tmp_path = f"{self.metadata_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"model": self.embedder.model, "metadata": self.metadata}, file)
+        os.replace(tmp_path, self.metadata_path)
+        self.query_cache.flush()
 
     def load_db(self):
+        if not os.path.exists(self.embeddings_path):
+            self._migrate_pickle()
+        self.embeddings = _load_matrix(self.embeddings_path)
+        with open(self.metadata_path, "r") as file:
+            data = json.load(file)
+        if data.get("model", self.embedder.model) != self.embedder.model:
+            raise ValueError(
+                f"{self.metadata_path} was embedded with {data['model']!r}, "
+                f"not {self.embedder.model!r}."
+            )
+        self.metadata = data["metadata"]
+        self.filters.build(self.metadata)
+        self._sync_index()
+        if "query_cache" in data:
+            # Sidecars written before the query cache moved to its own log still embed it.
+            self.query_cache.update(data["query_cache"])
+            self.save_db()
+
+    def _migrate_pickle(self):
+        """Convert a legacy pickled database into the .npy matrix plus JSON sidecar format."""
         if not os.path.exists(self.db_path):
             raise ValueError(
                 "Vector database file not found. Use load_data to create a new database."
@@ -77,6 +237,7 @@ class VectorDB:
 
         with open(self.db_path, "rb") as file:
             data = pickle.load(file)
-        self.embeddings = data["embeddings"]
+        self.embeddings = _to_matrix(data["embeddings"])
         self.metadata = data["metadata"]
-        self.query_cache = json.loads(data["query_cache"])
+        self.query_cache.update(json.loads(data["query_cache"]))
+        self.save_db()
@@ -0,0 +1,117 @@
+"""Evaluate a retriever over the whole evaluation dataset in one process.
+
+The promptfoo eval calls eval_retrieval.get_assert once per row, in a subprocess.
+This runner instead retrieves every question concurrently, scores all of them at
+once with array operations (the same precision, recall, F1 and MRR definitions as
+eval_retrieval.py), and writes one column per metric to an .npz file:
+
+    python batch_eval.py retrieve_level_two --output ../data/level_two_eval.npz
+
+A retriever is any function from a query string to a ranked list of chunk links,
+such as those in retrievers.py; "module:function" names one from another module.
+"""
+
+import argparse
+import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+METRICS = ("precision", "recall", "f1", "mrr")
+
+
+def load_dataset(path="docs_evaluation_dataset.json"):
+    """(ids, questions, correct chunk links per question) from the evaluation JSON."""
+    with open(path, "r") as f:
+        dataset = json.load(f)
+    return (
+        [item["id"] for item in dataset],
+        [item["question"] for item in dataset],
+        [item["correct_chunks"] for item in dataset],
+    )
+
+
+def run_retrieval(retrieve, queries, max_workers=8):
+    """retrieve(query) for every query, up to `max_workers` at a time, in order."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(retrieve, queries))
+
+
+def _link_matrix(link_lists, vocab):
+    """Link ids as an (n_queries, longest list) int64 matrix padded with -1."""
+    width = max((len(links) for links in link_lists), default=0)
+    matrix = np.full((len(link_lists), width), -1, dtype=np.int64)
+    for row, links in enumerate(link_lists):
+        matrix[row, : len(links)] = [vocab.setdefault(link, len(vocab)) for link in links]
+    return matrix
+
+
+def retrieval_metrics(retrieved, correct):
+    """Per-query precision, recall, F1 and MRR arrays for parallel lists of link lists.
+
+    Matches eval_retrieval.evaluate_retrieval: a link retrieved twice counts once
+    towards the true positives but twice towards the number retrieved.
+    """
+    vocab = {}
+    retrieved_ids = _link_matrix(retrieved, vocab)
+    correct_ids = _link_matrix(correct, vocab)
+    n, width = retrieved_ids.shape
+    # Encode (query, link) pairs as single integers so membership is one isin call.
+    rows = np.arange(n)[:, None]
+    retrieved_keys = rows * len(vocab) + retrieved_ids
+    correct_keys = (rows * len(vocab) + correct_ids)[correct_ids >= 0]
+    hits = np.isin(retrieved_keys, correct_keys) & (retrieved_ids >= 0)
+    # Only the first occurrence of each (query, link) pair is a true positive.
+    first = np.zeros(retrieved_keys.size, dtype=bool)
+    first[np.unique(retrieved_keys.ravel(), return_index=True)[1]] = True
+    true_positives = (hits & first.reshape(n, width)).sum(axis=1)
+
+    n_retrieved = (retrieved_ids >= 0).sum(axis=1)
+    n_correct = (correct_ids >= 0).sum(axis=1)
+    precision = np.divide(true_positives, n_retrieved, out=np.zeros(n), where=n_retrieved > 0)
+    recall = np.divide(true_positives, n_correct, out=np.zeros(n), where=n_correct > 0)
+    total = precision + recall
+    f1 = np.divide(2 * precision * recall, total, out=np.zeros(n), where=total > 0)
+    first_hit = hits.argmax(axis=1) if width else np.zeros(n, dtype=np.int64)
+    mrr = np.where(hits.any(axis=1), 1 / (first_hit + 1), 0.0)
+    return {"precision": precision, "recall": recall, "f1": f1, "mrr": mrr}
+
+
+def evaluate(retrieve, dataset_path="docs_evaluation_dataset.json", output=None, max_workers=8):
+    """Run `retrieve` over the dataset and return the average of each metric.
+
+    With `output`, also saves the per-query columns (id, question, retrieved links
+    as JSON, and each metric) plus the averages to that .npz file.
+    """
+    ids, questions, correct = load_dataset(dataset_path)
+    retrieved = run_retrieval(retrieve, questions, max_workers=max_workers)
+    metrics = retrieval_metrics(retrieved, correct)
+    averages = {f"average_{name}": float(metrics[name].mean()) for name in METRICS}
+    if output is not None:
+        with open(output, "wb") as file:
+            np.savez(
+                file,
+                id=np.array(ids, dtype=str),
+                question=np.array(questions, dtype=str),
+                retrieved=np.array([json.dumps(links) for links in retrieved], dtype=str),
+                **metrics,
+                **averages,
+            )
+    return averages
+
+
+def _resolve(name):
+    module, _, function = name.rpartition(":")
+    return getattr(importlib.import_module(module or "retrievers"), function)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("retriever", help="function in retrievers.py, or module:function")
+    parser.add_argument("--dataset", default="docs_evaluation_dataset.json")
+    parser.add_argument("--output", help=".npz file for the per-query results")
+    parser.add_argument("--max-workers", type=int, default=8)
+    args = parser.parse_args()
+    averages = evaluate(_resolve(args.retriever), args.dataset, args.output, args.max_workers)
+    print(json.dumps(averages, indent=2))
@@ -0,0 +1,391 @@
+"""Benchmark build time, latency, throughput, memory and recall of the vector stores.
+
+Every corpus the cookbooks index is rebuilt offline with HashingEmbedder, at its
+real size and at synthetic multiples of it, and searched with each index:
+
+    python benchmark.py --scales 1,10,100 --output ../data/benchmark_results.json
+
+    rag             ../data/anthropic_docs.json in VectorDB
+    summary         ../data/anthropic_summary_indexed_docs.json in SummaryIndexedVectorDB
+    classification  classification/data/train.tsv in the classification VectorDB
+    contextual      contextual-embeddings/data/codebase_chunks.json in VectorDB
+
+Synthetic copies drop and swap a fraction of each chunk's words, so a 100x corpus
+has 100 distinct neighbours per original chunk rather than exact duplicates.
+Each (corpus, scale) is built in its own process and each index is searched in
+another, so peak RSS is measured per index. Latencies are for single-query
+search() calls with the query embeddings already cached, so they measure search
+alone. Recall@k is measured against an exact scan of the same matrix.
+
+The results are written as JSON. Passing --baseline with an earlier results file
+reports every latency, throughput or recall regression beyond --tolerance and
+exits with status 1 if there is one.
+"""
+
+import argparse
+import csv
+import importlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CAPABILITIES = os.path.dirname(os.path.dirname(HERE))
+RAG_DATA = os.path.join(HERE, "..", "data")
+CLASSIFICATION_DIR = os.path.join(CAPABILITIES, "classification", "evaluation")
+CONTEXTUAL_DATA = os.path.join(CAPABILITIES, "contextual-embeddings", "data")
+
+# hnsw is built in pure Python and takes minutes at 100x, so it is opt-in.
+DEFAULT_INDEXES = ("exact", "ivf", "sq8", "pq", "binary", "projection")
+
+
+def _make_index(name):
+    # Imported from the corpus's own directory, which _open_store puts first on sys.path.
+    from indexes import HNSWIndex, IVFIndex
+    from quantization import BinaryIndex, PQIndex, ProjectionIndex, ScalarQuantizedIndex
+
+    return {
+        "exact": lambda: None,
+        "ivf": IVFIndex,
+        "hnsw": HNSWIndex,
+        "sq8": ScalarQuantizedIndex,
+        "pq": PQIndex,
+        "binary": BinaryIndex,
+        "projection": ProjectionIndex,
+    }[name]()
+
+
+def _load_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _read_tsv(path):
+    with open(path, "r", newline="") as f:
+        return list(csv.DictReader(f, delimiter="\t"))
+
+
+def _docs_questions():
+    return [
+        item["question"] for item in _load_json(os.path.join(HERE, "docs_evaluation_dataset.json"))
+    ]
+
+
+def rag_corpus():
+    return _load_json(os.path.join(RAG_DATA, "anthropic_docs.json")), _docs_questions()
+
+
+def summary_corpus():
+    items = _load_json(os.path.join(RAG_DATA, "anthropic_summary_indexed_docs.json"))
+    return items, _docs_questions()
+
+
+def classification_corpus():
+    train = _read_tsv(os.path.join(CLASSIFICATION_DIR, "..", "data", "train.tsv"))
+    test = _read_tsv(os.path.join(CLASSIFICATION_DIR, "..", "data", "test.tsv"))
+    items = [
+        {"id": f"train-{i}", "text": row["text"], "label": row["label"]}
+        for i, row in enumerate(train)
+    ]
+    return items, [row["text"] for row in test]
+
+
+def contextual_corpus():
+    """Codebase chunks, each prefixed with a stand-in for its generated context."""
+    items = []
+    for doc in _load_json(os.path.join(CONTEXTUAL_DATA, "codebase_chunks.json")):
+        first_line = doc["content"].strip().split("\n", 1)[0]
+        for chunk in doc["chunks"]:
+            position = f"Chunk {chunk['original_index'] + 1} of {doc['doc_id']}"
+            context = f"{position}, which begins: {first_line}"
+            items.append(
+                {
+                    "chunk_link": f"{doc['doc_id']}_{chunk['chunk_id']}",
+                    "chunk_heading": doc["doc_id"],
+                    "text": f"{context}\n\n{chunk['content']}",
+                }
+            )
+    with open(os.path.join(CONTEXTUAL_DATA, "evaluation_set.jsonl"), "r") as f:
+        queries = [json.loads(line)["query"] for line in f if line.strip()]
+    return items, queries
+
+
+# name -> (loader, directory of its vectordb.py, store class, id field)
+CORPORA = {
+    "rag": (rag_corpus, HERE, "VectorDB", "chunk_link"),
+    "summary": (summary_corpus, HERE, "SummaryIndexedVectorDB", "chunk_link"),
+    "classification": (classification_corpus, CLASSIFICATION_DIR, "VectorDB", "id"),
+    "contextual": (contextual_corpus, HERE, "VectorDB", "chunk_link"),
+}
+
+
+def scale_corpus(items, scale, id_field, drop=0.2, seed=0):
+    """`items` followed by scale - 1 perturbed copies of each, with distinct ids.
+
+    A copy drops each word of "text" with probability `drop` and replaces as many
+    others with words drawn from the whole corpus.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(sorted({word for item in items for word in item["text"].split()}))
+    scaled = list(items)
+    for copy in range(1, scale):
+        for item in items:
+            words = np.array(item["text"].split() or [""])
+            kept = words[rng.random(len(words)) >= drop]
+            swapped = rng.random(len(kept)) < drop
+            kept[swapped] = rng.choice(vocabulary, size=int(swapped.sum()))
+            scaled.append({**item, id_field: f"{item[id_field]}#{copy}", "text": " ".join(kept)})
+    return scaled
+
+
+def _open_store(corpus, index, dim, workdir):
+    """A store for `corpus` rooted in `workdir`, imported from the corpus's own directory."""
+    _, directory, store_class, _ = CORPORA[corpus]
+    sys.path.insert(0, directory)
+    os.chdir(os.path.join(workdir, "work"))
+    vectordb = importlib.import_module("vectordb")
+    from embedders import HashingEmbedder
+    from embedding_cache import EmbeddingCache
+
+    kwargs = {
+        "embedder": HashingEmbedder(dim=dim),
+        "embedding_cache": EmbeddingCache(os.path.join(workdir, "embeddings.sqlite3")),
+    }
+    if corpus == "classification":
+        return vectordb.VectorDB(index=_make_index(index), **kwargs)
+    return getattr(vectordb, store_class)("benchmark", index=_make_index(index), **kwargs)
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def _index_mb(db):
+    if db.index is not None:
+        return os.path.getsize(db.index_path) / (1 << 20)
+    return 0.0
+
+
+def build_case(corpus, scale, dim, workdir):
+    """Build the scaled corpus's store with an exact scan and time it."""
+    loader, _, _, id_field = CORPORA[corpus]
+    items, _ = loader()
+    items = scale_corpus(items, scale, id_field)
+    db = _open_store(corpus, "exact", dim, workdir)
+    start = time.perf_counter()
+    db.load_data(items)
+    build_seconds = time.perf_counter() - start
+    return {
+        "n_chunks": len(items),
+        "build_seconds": build_seconds,
+        "embeddings_mb": os.path.getsize(db.embeddings_path) / (1 << 20),
+        "build_peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def query_case(corpus, index, dim, workdir, k, n_queries, concurrency, rounds):
+    """Open the built store with `index` and measure latency, throughput and recall."""
+    loader, _, _, id_field = CORPORA[corpus]
+    _, queries = loader()
+    queries = queries[:n_queries]
+    db = _open_store(corpus, index, dim, workdir)
+
+    def search(query):
+        return db.search(query, k=k, similarity_threshold=-1.0)
+
+    # Opening includes building or loading the index and any fit done on first search.
+    start = time.perf_counter()
+    db.load_db()
+    search(queries[0])
+    open_seconds = time.perf_counter() - start
+    results = [search(query) for query in queries]  # also caches every query embedding
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+
+    requests = queries * rounds
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(search, requests))
+    qps = len(requests) / (time.perf_counter() - start)
+
+    embeddings = np.asarray(db.embeddings)
+    similarities = db._embed_queries(queries) @ embeddings.T
+    exact = np.argpartition(-similarities, min(k, len(embeddings)) - 1, axis=1)[:, :k]
+    ids = [item[id_field] for item in db.metadata]
+    recall = np.mean(
+        [
+            len({ids[row] for row in rows} & {r["metadata"][id_field] for r in found}) / len(rows)
+            for rows, found in zip(exact, results)
+        ]
+    )
+    return {
+        "open_seconds": open_seconds,
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p95": float(np.percentile(latencies_ms, 95)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+        },
+        "qps": qps,
+        f"recall_at_{k}": float(recall),
+        "index_mb": _index_mb(db),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_worker(stage, **kwargs):
+    """Run build_case or query_case in a fresh interpreter and return its result."""
+    completed = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--worker",
+            json.dumps({"stage": stage, **kwargs}),
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"benchmark {stage} worker failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(corpora, scales, indexes, dim=1024, k=10, n_queries=100, concurrency=8, rounds=3):
+    """One result per (corpus, scale, index), each a flat dict of settings and measurements."""
+    results = []
+    for corpus in corpora:
+        for scale in scales:
+            workdir = tempfile.mkdtemp(prefix=f"benchmark_{corpus}_{scale}x_")
+            try:
+                # The classification store keeps its files in ../data relative to the cwd.
+                os.makedirs(os.path.join(workdir, "work"))
+                os.makedirs(os.path.join(workdir, "data"))
+                build = _run_worker("build", corpus=corpus, scale=scale, dim=dim, workdir=workdir)
+                for index in indexes:
+                    measured = _run_worker(
+                        "query",
+                        corpus=corpus,
+                        index=index,
+                        dim=dim,
+                        workdir=workdir,
+                        k=k,
+                        n_queries=n_queries,
+                        concurrency=concurrency,
+                        rounds=rounds,
+                    )
+                    result = {"corpus": corpus, "scale": scale, "index": index, **build, **measured}
+                    results.append(result)
+                    print(
+                        f"{corpus:>14} {scale:>4}x {index:>10}: {build['n_chunks']} chunks, "
+                        f"p50 {measured['latency_ms']['p50']:.2f} ms, "
+                        f"p99 {measured['latency_ms']['p99']:.2f} ms, {measured['qps']:.0f} qps, "
+                        f"recall@{k} {measured[f'recall_at_{k}']:.3f}",
+                        file=sys.stderr,
+                    )
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, recall_drop=0.01):
+    """Regressions of `results` against `baseline` results, as readable messages.
+
+    Latency may grow and QPS shrink by up to `tolerance` (a fraction), and recall may
+    drop by up to `recall_drop`, before a case counts as regressed.
+    """
+    previous = {(r["corpus"], r["scale"], r["index"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result["corpus"], result["scale"], result["index"]))
+        if old is None:
+            continue
+        case = f"{result['corpus']} {result['scale']}x {result['index']}"
+        for percentile in ("p50", "p95", "p99"):
+            new_ms, old_ms = result["latency_ms"][percentile], old["latency_ms"][percentile]
+            if new_ms > old_ms * (1 + tolerance):
+                regressions.append(f"{case}: {percentile} latency {old_ms:.2f} -> {new_ms:.2f} ms")
+        if result["qps"] < old["qps"] * (1 - tolerance):
+            regressions.append(f"{case}: throughput {old['qps']:.0f} -> {result['qps']:.0f} qps")
+        for key in result:
+            if key.startswith("recall_at_") and key in old and result[key] < old[key] - recall_drop:
+                regressions.append(f"{case}: {key} {old[key]:.3f} -> {result[key]:.3f}")
+    return regressions
+
+
+def _environment(dim):
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "embedder": f"HashingEmbedder(dim={dim})",
+    }
+
+
+def _csv(value):
+    return [item for item in value.split(",") if item]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpora", type=_csv, default=list(CORPORA))
+    parser.add_argument("--scales", type=lambda v: [int(s) for s in _csv(v)], default=[1, 10, 100])
+    parser.add_argument("--indexes", type=_csv, default=list(DEFAULT_INDEXES))
+    parser.add_argument("--dim", type=int, default=1024, help="embedding dimensions")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=100, help="queries per corpus")
+    parser.add_argument("--concurrency", type=int, default=8, help="threads for the QPS run")
+    parser.add_argument("--rounds", type=int, default=3, help="passes over the queries for QPS")
+    parser.add_argument("--output", default=os.path.join(RAG_DATA, "benchmark_results.json"))
+    parser.add_argument("--baseline", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        spec = json.loads(args.worker)
+        stage = spec.pop("stage")
+        print(json.dumps((build_case if stage == "build" else query_case)(**spec)))
+        sys.exit(0)
+
+    results = run(
+        args.corpora,
+        args.scales,
+        args.indexes,
+        args.dim,
+        args.k,
+        args.queries,
+        args.concurrency,
+        args.rounds,
+    )
+    report = {
+        "environment": _environment(args.dim),
+        "settings": {key: getattr(args, key) for key in ("k", "queries", "concurrency", "rounds")},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+    if args.baseline:
+        regressions = compare(results, _load_json(args.baseline)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
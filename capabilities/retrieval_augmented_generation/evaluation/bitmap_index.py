@@ -0,0 +1,90 @@
+import numpy as np
+
+
+class BitmapIndex:
+    """Inverted index from metadata field values to the rows that carry them.
+
+    Each value of an indexed field maps to its rows, stored as a packed bitmap
+    (n / 8 bytes) when the value is common and as a sorted int32 row-id array when
+    it is rare enough that the ids take less space (fewer than n / 32 rows), so
+    unique fields such as links stay small. `mask(where)` combines the entries into
+    one boolean row mask without touching the metadata or the embeddings:
+
+        {"label": "Billing Inquiries"}             rows whose label equals the value
+        {"label": ["Billing Inquiries", "Quotes"]} rows matching any listed value
+        {"chunk_heading": h, "chunk_link": l}      every field must match
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self._vocab = {field: {} for field in self.fields}  # value -> value id
+        self._entries = {field: {} for field in self.fields}  # value id -> bitmap or row ids
+
+    def __len__(self):
+        return self.size
+
+    def build(self, metadata):
+        self._reset()
+        self.add(metadata, 0)
+
+    def add(self, metadata, start):
+        """Index rows metadata[start:] that were appended since the last build or add."""
+        if start != self.size:
+            self.build(metadata)
+            return
+        new_items = metadata[start:]
+        self.size = len(metadata)
+        for field in self.fields:
+            vocab = self._vocab[field]
+            new_codes = np.fromiter(
+                (vocab.setdefault(item.get(field), len(vocab)) for item in new_items),
+                dtype=np.int32,
+                count=len(new_items),
+            )
+            # Group only the new rows by value; each value that gained rows is re-encoded
+            # from its old entry plus them, so an append never re-sorts the rows already indexed.
+            order = np.argsort(new_codes, kind="stable").astype(np.int32)
+            value_ids, firsts = np.unique(new_codes[order], return_index=True)
+            for value_id, rows in zip(value_ids.tolist(), np.split(order + start, firsts[1:])):
+                entry = self._entries[field].get(value_id)
+                if entry is not None:
+                    rows = np.concatenate([self._rows(entry), rows])
+                self._entries[field][value_id] = self._encode(rows)
+
+    @staticmethod
+    def _rows(entry):
+        if entry.dtype == np.uint8:
+            return np.flatnonzero(np.unpackbits(entry)).astype(np.int32)
+        return entry
+
+    def _encode(self, rows):
+        if len(rows) * 32 < self.size:
+            return rows
+        bitmap = np.zeros(self.size, dtype=bool)
+        bitmap[rows] = True
+        return np.packbits(bitmap)
+
+    def mask(self, where):
+        """Boolean mask of the rows matching every field of `where`."""
+        mask = np.ones(self.size, dtype=bool)
+        for field, wanted in where.items():
+            if field not in self._vocab:
+                raise ValueError(f"Cannot filter on {field!r}; indexed fields are {self.fields}.")
+            values = wanted if isinstance(wanted, (list, tuple, set, frozenset)) else [wanted]
+            field_mask = np.zeros(self.size, dtype=bool)
+            for value in values:
+                value_id = self._vocab[field].get(value)
+                if value_id is None:
+                    continue
+                entry = self._entries[field][value_id]
+                if entry.dtype == np.uint8:
+                    # Bitmaps built before later appends are shorter; unpackbits pads with zeros.
+                    field_mask |= np.unpackbits(entry, count=self.size).view(bool)
+                else:
+                    field_mask[entry] = True
+            mask &= field_mask
+        return mask
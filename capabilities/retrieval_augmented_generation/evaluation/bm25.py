@@ -0,0 +1,161 @@
+"""In-process BM25 lexical index and score fusion for hybrid retrieval.
+
+BM25Index keeps its postings as flat arrays in CSR layout (one slice of document
+ids per term) with the BM25 weight of every posting precomputed from the term
+frequency, document length and idf, so a query is a handful of array slices and
+one bincount instead of a per-document loop.
+"""
+
+import re
+from collections import Counter
+
+import numpy as np
+from indexes import _save_npz, _top_k
+
+_WORD = re.compile(r"\w+")
+# Sub-words of an identifier: "parseHTTPResponse_v2" -> parse, HTTP, Response, v, 2.
+_SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text):
+    """Lowercased words, plus the camelCase / snake_case parts of compound identifiers."""
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(word.lower())
+        parts = _SUBWORD.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a list of texts, with `k1` and `b` as usual."""
+
+    name = "bm25"
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._reset()
+
+    def _reset(self):
+        self.vocab = {}  # term -> term id
+        self.doc_lengths = np.empty(0, dtype=np.int32)
+        # Postings as (term id, doc id, term frequency) triples, grouped by term.
+        self._terms = np.empty(0, dtype=np.int32)
+        self._docs = np.empty(0, dtype=np.int32)
+        self._tfs = np.empty(0, dtype=np.int32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._weights = np.empty(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def build(self, texts):
+        self._reset()
+        self.add(texts, 0)
+
+    def add(self, texts, start):
+        """Index texts[start:], which were appended since the last build or add."""
+        if start != len(self):
+            self.build(texts)
+            return
+        terms, docs, tfs, lengths = [], [], [], []
+        for doc_id, text in enumerate(texts[start:], start):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                terms.append(self.vocab.setdefault(term, len(self.vocab)))
+                docs.append(doc_id)
+                tfs.append(tf)
+        self.doc_lengths = np.concatenate([self.doc_lengths, np.array(lengths, dtype=np.int32)])
+        self._terms = np.concatenate([self._terms, np.array(terms, dtype=np.int32)])
+        self._docs = np.concatenate([self._docs, np.array(docs, dtype=np.int32)])
+        self._tfs = np.concatenate([self._tfs, np.array(tfs, dtype=np.int32)])
+        self._finalize()
+
+    def _finalize(self):
+        # Idf and the average length change with every added document, so all weights are
+        # recomputed; it is a few vectorised passes over the postings.
+        order = np.argsort(self._terms, kind="stable")
+        self._terms, self._docs, self._tfs = self._terms[order], self._docs[order], self._tfs[order]
+        doc_freqs = np.bincount(self._terms, minlength=len(self.vocab))
+        self._offsets = np.concatenate([[0], np.cumsum(doc_freqs)])
+        idf = np.log1p((len(self) - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        avg_length = max(self.doc_lengths.mean(), 1.0) if len(self) else 1.0
+        tfs = self._tfs.astype(np.float32)
+        norms = self.k1 * (1 - self.b + self.b * self.doc_lengths[self._docs] / avg_length)
+        self._weights = (idf[self._terms] * tfs * (self.k1 + 1) / (tfs + norms)).astype(np.float32)
+
+    def scores(self, text):
+        """BM25 score of every document for one query text."""
+        term_ids = {self.vocab[term] for term in tokenize(text) if term in self.vocab}
+        slices = [slice(self._offsets[t], self._offsets[t + 1]) for t in term_ids]
+        if not slices:
+            return np.zeros(len(self), dtype=np.float32)
+        docs = np.concatenate([self._docs[s] for s in slices])
+        weights = np.concatenate([self._weights[s] for s in slices])
+        return np.bincount(docs, weights=weights, minlength=len(self)).astype(np.float32)
+
+    def search(self, texts, k, mask=None):
+        """[(ids, scores)] of the k best-scoring documents per query, best first.
+
+        Documents sharing no term with the query are never returned; `mask`, a boolean
+        array over the documents, restricts the results to its True rows.
+        """
+        results = []
+        for text in texts:
+            scores = self.scores(text)
+            if mask is not None:
+                scores[~mask] = 0
+            candidates = np.flatnonzero(scores > 0)
+            top = candidates[_top_k(scores[candidates], k)]
+            results.append((top, scores[top]))
+        return results
+
+    def save(self, path):
+        _save_npz(
+            path,
+            terms=np.array(list(self.vocab), dtype=str),
+            doc_lengths=self.doc_lengths,
+            term_ids=self._terms,
+            doc_ids=self._docs,
+            tfs=self._tfs,
+        )
+
+    def load(self, path):
+        data = np.load(path)
+        self.vocab = {term: i for i, term in enumerate(data["terms"].tolist())}
+        self.doc_lengths = data["doc_lengths"]
+        self._terms, self._docs, self._tfs = data["term_ids"], data["doc_ids"], data["tfs"]
+        self._finalize()
+
+
+def fuse_rrf(hit_lists, k, rrf_k=60):
+    """Reciprocal rank fusion: sum of 1 / (rrf_k + rank) over the ranked (ids, scores) lists."""
+    fused = Counter()
+    for ids, _ in hit_lists:
+        for rank, row in enumerate(ids.tolist(), 1):
+            fused[row] += 1 / (rrf_k + rank)
+    return _ranked(fused, k)
+
+
+def fuse_weighted(hit_lists, weights, k):
+    """Weighted sum of each list's min-max normalised scores (0 where a row is missing)."""
+    fused = Counter()
+    for (ids, scores), weight in zip(hit_lists, weights):
+        if not len(ids):
+            continue
+        low, high = float(scores.min()), float(scores.max())
+        normalised = (scores - low) / (high - low) if high > low else np.ones(len(scores))
+        for row, score in zip(ids.tolist(), normalised.tolist()):
+            fused[row] += weight * score
+    return _ranked(fused, k)
+
+
+def _ranked(fused, k):
+    best = fused.most_common(max(k, 0))
+    return (
+        np.array([row for row, _ in best], dtype=np.int64),
+        np.array([score for _, score in best], dtype=np.float32),
+    )
@@ -0,0 +1 @@
+# Lets pytest import the flat evaluation modules (vectordb, indexes, ...) from any directory.
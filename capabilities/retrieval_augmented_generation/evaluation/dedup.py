@@ -0,0 +1,117 @@
+"""Near-duplicate detection with MinHash signatures and locality-sensitive hashing.
+
+Each text becomes a set of word shingles, summarised by a MinHash signature whose
+positions agree between two texts with probability equal to their Jaccard
+similarity. LSH splits the signatures into bands and only compares texts that
+share a whole band, so a corpus is deduplicated in roughly linear time instead of
+comparing every pair.
+"""
+
+import zlib
+
+import numpy as np
+
+_PRIME = (1 << 61) - 1
+
+
+def _shingle_hashes(text, shingle_size):
+    """32-bit hashes of the text's overlapping `shingle_size`-word shingles."""
+    words = text.lower().split()
+    tokens = np.array([zlib.crc32(word.encode()) for word in words], dtype=np.uint64)
+    if len(tokens) < shingle_size:
+        return np.array([zlib.crc32(" ".join(words).encode())], dtype=np.uint64)
+    # Polynomial hash of each window of token hashes, kept to 32 bits.
+    n = len(tokens) - shingle_size + 1
+    hashes = np.zeros(n, dtype=np.uint64)
+    for offset in range(shingle_size):
+        hashes = (hashes * np.uint64(1_000_003) + tokens[offset : offset + n]) & np.uint64(
+            0xFFFFFFFF
+        )
+    return np.unique(hashes)
+
+
+class MinHasher:
+    """MinHash signatures of `num_perm` uint32 values over word shingles."""
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=0):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # (a * x + b) mod p with a, b < 2^31 and x < 2^32 never overflows uint64.
+        self._a = rng.integers(1, 1 << 31, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=(num_perm, 1), dtype=np.uint64)
+
+    def signatures(self, texts):
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for row, text in enumerate(texts):
+            shingles = _shingle_hashes(text, self.shingle_size)
+            permuted = (self._a * shingles + self._b) % np.uint64(_PRIME)
+            signatures[row] = (permuted & np.uint64(0xFFFFFFFF)).min(axis=1)
+        return signatures
+
+
+def _choose_bands(num_perm, threshold):
+    """Band count whose LSH threshold (1/b)^(1/r) is the highest one not above `threshold`."""
+    options = [
+        (b, num_perm // b)
+        for b in range(1, num_perm + 1)
+        if num_perm % b == 0 and (1 / b) ** (b / num_perm) <= threshold
+    ]
+    return max(options, key=lambda option: (1 / option[0]) ** (1 / option[1]))[0]
+
+
+def near_duplicate_groups(signatures, threshold=0.9, bands=None):
+    """Representative row for every row: the first row of its near-duplicate cluster.
+
+    Rows landing in the same bucket of any band are compared with that bucket's first
+    row, and joined when their estimated Jaccard similarity reaches `threshold`.
+    Clusters are transitive, so a chain of close texts collapses into one.
+    """
+    n, num_perm = signatures.shape
+    bands = bands or _choose_bands(num_perm, threshold)
+    rows_per_band = num_perm // bands
+    parent = np.arange(n)
+
+    def find(row):
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    for band in range(bands):
+        block = np.ascontiguousarray(
+            signatures[:, band * rows_per_band : (band + 1) * rows_per_band]
+        )
+        keys = block.view(np.dtype((np.void, block.shape[1] * block.itemsize))).ravel()
+        _, buckets = np.unique(keys, return_inverse=True)
+        order = np.argsort(buckets, kind="stable")
+        starts = np.flatnonzero(np.diff(buckets[order], prepend=-1))
+        for members in np.split(order, starts[1:]):
+            if len(members) < 2:
+                continue
+            similarity = (signatures[members[1:]] == signatures[members[0]]).mean(axis=1)
+            for row in members[1:][similarity >= threshold]:
+                a, b = find(members[0]), find(row)
+                parent[max(a, b)] = min(a, b)
+    return np.array([find(row) for row in range(n)])
+
+
+def collapse_near_duplicates(items, texts, id_field, threshold=0.9, hasher=None):
+    """Keep the first item of each near-duplicate cluster of `texts`, in order.
+
+    A kept item that absorbed others is copied with a "duplicates" list holding their
+    `id_field` values, so links to every copy survive the collapse.
+    """
+    if not items:
+        return []
+    hasher = hasher or MinHasher()
+    representatives = near_duplicate_groups(hasher.signatures(texts), threshold)
+    duplicates = {}
+    for row, representative in enumerate(representatives.tolist()):
+        if row != representative:
+            duplicates.setdefault(representative, []).append(items[row][id_field])
+    return [
+        {**item, "duplicates": duplicates[row]} if row in duplicates else item
+        for row, item in enumerate(items)
+        if representatives[row] == row
+    ]
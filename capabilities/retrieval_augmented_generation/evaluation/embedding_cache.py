@@ -0,0 +1,102 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from embedding_pipeline import EmbeddingPipeline
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "cookbook_embeddings.sqlite3")
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store shared by every vector database.
+
+    Embeddings are keyed by (model, sha256(text)) in one SQLite file, so any store,
+    process or experiment that embeds a text another one already paid for reads it
+    back instead of calling the API. The file defaults to `EMBEDDING_CACHE_PATH` or
+    ~/.cache/cookbook_embeddings.sqlite3 and is opened in WAL mode, so concurrent
+    readers never block on a writer.
+    """
+
+    def __init__(self, path=None, chunk_size=500):
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_PATH)
+        self.chunk_size = chunk_size  # keys per SQL statement, below SQLite's variable limit
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, digest))"
+            )
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, texts):
+        """Cached float32 embeddings of `texts` in order, with None for each miss."""
+        digests = [self._digest(text) for text in texts]
+        found = {}
+        with self._lock:
+            for i in range(0, len(digests), self.chunk_size):
+                chunk = digests[i : i + self.chunk_size]
+                rows = self._connection.execute(
+                    "SELECT digest, vector FROM embeddings WHERE model = ? "
+                    f"AND digest IN ({', '.join('?' * len(chunk))})",
+                    [model, *chunk],
+                )
+                found.update(rows)
+        embeddings = [
+            np.frombuffer(found[digest], dtype=np.float32) if digest in found else None
+            for digest in digests
+        ]
+        self.hits += sum(embedding is not None for embedding in embeddings)
+        self.misses += sum(embedding is None for embedding in embeddings)
+        return embeddings
+
+    def put_many(self, model, texts, embeddings):
+        rows = [
+            (model, self._digest(text), np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, digest, vector) VALUES (?, ?, ?)", rows
+            )
+
+    def embed(self, embedder, texts, pipeline=None):
+        """Embed `texts` with `embedder`, computing only texts it never embedded before.
+
+        Duplicate texts within the call are embedded once. Misses go through `pipeline`
+        (an EmbeddingPipeline; a default one if None), and each batch is stored as soon
+        as it returns, so an interrupted run keeps everything it already paid for.
+        Embedders marked `cacheable = False` bypass the cache entirely.
+        """
+        pipeline = pipeline or EmbeddingPipeline()
+        if not embedder.cacheable:
+            return [np.asarray(e, dtype=np.float32) for e in pipeline.embed(embedder, texts)]
+        model = embedder.model
+        embeddings = self.get_many(model, texts)
+        missing = list(dict.fromkeys(text for text, e in zip(texts, embeddings) if e is None))
+        fetched = {}
+
+        def store(batch, result):
+            self.put_many(model, batch, result)
+            fetched.update(zip(batch, result))
+
+        if missing:
+            pipeline.embed(embedder, missing, on_batch=store)
+        return [
+            np.asarray(fetched[text], dtype=np.float32) if embedding is None else embedding
+            for text, embedding in zip(texts, embeddings)
+        ]
@@ -0,0 +1,332 @@
+"""Approximate nearest-neighbour indexes that VectorDB can search through.
+
+An index never owns the vectors: VectorDB passes its (possibly memory-mapped)
+embedding matrix in. Every index implements:
+
+    build(embeddings)            index every row from scratch
+    add(embeddings, start)       index rows embeddings[start:] that were appended
+    search(embeddings, queries, k, mask=None) -> [(ids, scores), ...] best first, one per query
+    save(path) / load(path)      persist to / restore from an .npz file
+
+`mask`, a boolean array over the rows, restricts the results to its True rows
+(VectorDB uses it to skip tombstones). Masked rows are dropped before any
+candidate list is cut, so a query still gets k results if k rows are unmasked.
+"""
+
+import heapq
+
+import numpy as np
+
+
+def _top_k(scores, k):
+    """Positions of the k highest scores, best first."""
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if len(scores) > k:
+        top = np.argpartition(scores, -k)[-k:]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _cluster_sums(vectors, labels, n_clusters):
+    """Per-cluster sums and counts of vectors (a sort plus reduceat, much faster than add.at)."""
+    counts = np.bincount(labels, minlength=n_clusters)
+    sums = np.zeros((n_clusters, vectors.shape[1]), dtype=np.float32)
+    order = np.argsort(labels, kind="stable")
+    filled = np.flatnonzero(counts)
+    starts = np.concatenate([[0], np.cumsum(counts[filled])[:-1]])
+    sums[filled] = np.add.reduceat(vectors[order], starts, axis=0)
+    return sums, counts
+
+
+def _save_npz(path, **arrays):
+    with open(path, "wb") as file:
+        np.savez(file, **arrays)
+
+
+class IVFIndex:
+    """Inverted-file index: spherical k-means centroids with one posting list per cluster.
+
+    A query scores every centroid, scans only the rows in its `nprobe` closest
+    clusters, and returns their exact top-k. Raising `nprobe` trades latency for
+    recall; `nprobe == n_lists` is an exact search. Rows added later are assigned to
+    their nearest centroid, and the centroids are retrained once the corpus has
+    doubled since they were fitted.
+    """
+
+    name = "ivf"
+
+    def __init__(self, n_lists=None, nprobe=8, n_iter=20, sample_size=256, seed=0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.sample_size = sample_size  # training rows per centroid
+        self.seed = seed
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.trained_size = 0
+        self._order = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def build(self, embeddings):
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(embeddings))))
+        self.centroids = self._train(embeddings, min(n_lists, max(1, len(embeddings))))
+        self.trained_size = len(embeddings)
+        self.assignments = self._assign(embeddings)
+        self._rebuild_postings()
+
+    def add(self, embeddings, start):
+        if self.centroids is None or len(embeddings) > 2 * self.trained_size:
+            self.build(embeddings)
+            return
+        self.assignments = np.concatenate(
+            [self.assignments[:start], self._assign(embeddings[start:])]
+        )
+        self._rebuild_postings()
+
+    def _train(self, embeddings, n_lists):
+        rng = np.random.default_rng(self.seed)
+        n_sample = min(len(embeddings), n_lists * self.sample_size)
+        sample = np.asarray(
+            embeddings[np.sort(rng.choice(len(embeddings), n_sample, replace=False))]
+        )
+        centroids = sample[rng.choice(n_sample, n_lists, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums, counts = _cluster_sums(sample, labels, n_lists)
+            empty = counts == 0
+            # Re-seed empty clusters with random rows so every list stays useful.
+            sums[empty] = sample[rng.choice(n_sample, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return centroids
+
+    def _assign(self, embeddings, block_size=65_536):
+        labels = [
+            np.argmax(embeddings[i : i + block_size] @ self.centroids.T, axis=1)
+            for i in range(0, len(embeddings), block_size)
+        ]
+        return np.concatenate(labels).astype(np.int32) if labels else np.empty(0, np.int32)
+
+    def _rebuild_postings(self):
+        # CSR layout: rows of list c are _order[_offsets[c] : _offsets[c + 1]].
+        self._order = np.argsort(self.assignments, kind="stable")
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def search(self, embeddings, queries, k, nprobe=None, mask=None):
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        centroid_scores = queries @ self.centroids.T
+        results = []
+        for query, scores in zip(queries, centroid_scores):
+            lists = _top_k(scores, nprobe)
+            ids = np.concatenate(
+                [self._order[self._offsets[c] : self._offsets[c + 1]] for c in lists]
+            )
+            ids.sort()  # sequential reads from the (memory-mapped) matrix
+            if mask is not None:
+                ids = ids[mask[ids]]
+            candidate_scores = embeddings[ids] @ query
+            top = _top_k(candidate_scores, k)
+            results.append((ids[top], candidate_scores[top]))
+        return results
+
+    def save(self, path):
+        _save_npz(
+            path,
+            centroids=self.centroids,
+            assignments=self.assignments,
+            trained_size=self.trained_size,
+        )
+
+    def load(self, path):
+        data = np.load(path)
+        self.centroids = data["centroids"]
+        self.assignments = data["assignments"]
+        self.trained_size = int(data["trained_size"])
+        self._rebuild_postings()
+
+
+class HNSWIndex:
+    """Hierarchical navigable small-world graph built in-process.
+
+    Each row is inserted on a random number of layers; every layer links it to up
+    to `m` neighbours (`2 * m` on the base layer) chosen with the diversity
+    heuristic from an `ef_construction`-wide beam. A query descends greedily
+    through the upper layers and runs an `ef_search`-wide beam on the base layer;
+    raising `ef_search` trades latency for recall. Rows are inserted incrementally.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, m=16, ef_construction=200, ef_search=64, seed=0):
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / np.log(m)
+        self._rng = np.random.default_rng(seed)
+        self._reset()
+
+    def _reset(self):
+        self.levels = []
+        self.links = []  # links[layer][node] -> neighbour ids
+        self.entry_point = -1
+        self.max_level = -1
+
+    def __len__(self):
+        return len(self.levels)
+
+    def build(self, embeddings):
+        self._reset()
+        self.add(embeddings, 0)
+
+    def add(self, embeddings, start):
+        if start < len(self):
+            # Existing rows changed underneath the graph; it cannot be patched in place.
+            self.build(embeddings)
+            return
+        for node in range(len(self), len(embeddings)):
+            self._insert(embeddings, node)
+
+    def _insert(self, embeddings, node):
+        vector = embeddings[node]
+        level = int(-np.log(1.0 - self._rng.random()) * self.level_mult)
+        self.levels.append(level)
+        while len(self.links) <= level:
+            self.links.append({})
+        for layer in range(level + 1):
+            self.links[layer][node] = []
+        if self.entry_point < 0:
+            self.entry_point, self.max_level = node, level
+            return
+
+        entry_points = [self.entry_point]
+        for layer in range(self.max_level, level, -1):
+            entry_points = [self._search_layer(embeddings, vector, entry_points, 1, layer)[0][1]]
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(
+                embeddings, vector, entry_points, self.ef_construction, layer
+            )
+            neighbours = self._select(embeddings, candidates, self.m)
+            self.links[layer][node] = neighbours
+            max_links = 2 * self.m if layer == 0 else self.m
+            for neighbour in neighbours:
+                links = self.links[layer][neighbour]
+                links.append(node)
+                if len(links) > max_links:
+                    scores = (embeddings[links] @ embeddings[neighbour]).tolist()
+                    ranked = sorted(zip(scores, links), reverse=True)
+                    self.links[layer][neighbour] = self._select(embeddings, ranked, max_links)
+            entry_points = [candidate for _, candidate in candidates]
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+    def _select(self, embeddings, candidates, m):
+        """Pick up to m diverse neighbours from (score, id) candidates sorted best first.
+
+        A candidate is skipped while it is closer to an already selected neighbour
+        than to the base node; skipped candidates only fill any remaining slots.
+        """
+        ids = [candidate for _, candidate in candidates]
+        vectors = embeddings[ids]
+        pairwise = (vectors @ vectors.T).tolist()
+        selected, skipped = [], []
+        for i, (score, candidate) in enumerate(candidates):
+            if len(selected) >= m:
+                break
+            if selected and max(pairwise[i][j] for j in selected) > score:
+                skipped.append(i)
+            else:
+                selected.append(i)
+        selected += skipped[: m - len(selected)]
+        return [ids[i] for i in selected]
+
+    def _search_layer(self, embeddings, query, entry_points, ef, layer):
+        """Beam search one layer; returns up to ef (score, id) pairs, best first."""
+        links = self.links[layer]
+        visited = set(entry_points)
+        scores = (embeddings[entry_points] @ query).tolist()
+        candidates = [(-score, node) for score, node in zip(scores, entry_points)]
+        heapq.heapify(candidates)
+        found = [(score, node) for score, node in zip(scores, entry_points)]
+        heapq.heapify(found)
+        while candidates:
+            negative_score, node = heapq.heappop(candidates)
+            if len(found) >= ef and -negative_score < found[0][0]:
+                break
+            neighbours = [n for n in links[node] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for score, neighbour in zip((embeddings[neighbours] @ query).tolist(), neighbours):
+                if len(found) < ef or score > found[0][0]:
+                    heapq.heappush(candidates, (-score, neighbour))
+                    heapq.heappush(found, (score, neighbour))
+                    if len(found) > ef:
+                        heapq.heappop(found)
+        return sorted(found, reverse=True)
+
+    def search(self, embeddings, queries, k, ef_search=None, mask=None):
+        ef = max(ef_search or self.ef_search, k)
+        results = []
+        for query in queries:
+            if self.entry_point < 0 or k <= 0:
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            entry_points = [self.entry_point]
+            for layer in range(self.max_level, 0, -1):
+                entry_points = [self._search_layer(embeddings, query, entry_points, 1, layer)[0][1]]
+            found = self._search_layer(embeddings, query, entry_points, ef, 0)
+            if mask is not None:
+                # Masked nodes still route the search; widen it until k unmasked ones are found.
+                query_ef = ef
+                while True:
+                    live = [(score, node) for score, node in found if mask[node]]
+                    if len(live) >= k or query_ef >= len(self.levels):
+                        break
+                    query_ef *= 2
+                    found = self._search_layer(embeddings, query, entry_points, query_ef, 0)
+                found = live
+            found = found[:k]
+            results.append(
+                (
+                    np.array([node for _, node in found], dtype=np.int64),
+                    np.array([score for score, _ in found], dtype=np.float32),
+                )
+            )
+        return results
+
+    def save(self, path):
+        arrays = {
+            "levels": np.array(self.levels, dtype=np.int32),
+            "entry_point": self.entry_point,
+            "max_level": self.max_level,
+        }
+        # Each layer is stored as CSR: nodes[i] links to neighbours[offsets[i] : offsets[i + 1]].
+        for layer, links in enumerate(self.links):
+            nodes = sorted(links)
+            arrays[f"nodes_{layer}"] = np.array(nodes, dtype=np.int64)
+            arrays[f"offsets_{layer}"] = np.cumsum([0] + [len(links[n]) for n in nodes])
+            arrays[f"neighbours_{layer}"] = np.array(
+                [neighbour for n in nodes for neighbour in links[n]], dtype=np.int64
+            )
+        _save_npz(path, **arrays)
+
+    def load(self, path):
+        data = np.load(path)
+        self.levels = data["levels"].tolist()
+        self.entry_point = int(data["entry_point"])
+        self.max_level = int(data["max_level"])
+        self.links = []
+        for layer in range(self.max_level + 1):
+            nodes = data[f"nodes_{layer}"].tolist()
+            offsets = data[f"offsets_{layer}"].tolist()
+            neighbours = data[f"neighbours_{layer}"].tolist()
+            self.links.append(
+                {node: neighbours[offsets[i] : offsets[i + 1]] for i, node in enumerate(nodes)}
+            )
@@ -0,0 +1,200 @@
+import atexit
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# Every live cache, flushed by one at-exit hook; weak, so dropped caches can be collected.
+_open_caches = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_caches():
+    for cache in list(_open_caches):
+        cache.flush()
+
+
+class QueryCache:
+    """Bounded query-embedding cache persisted as an append-only JSON Lines log.
+
+    Entries are evicted least-recently-used first once the cache holds more than
+    `max_entries` embeddings or more than `max_bytes` of query text plus float32
+    vectors, and expire `ttl` seconds after they were embedded. `hits` and `misses`
+    count lookups made through `get()`.
+
+    New entries are buffered and appended to the log in batches (write-behind), so
+    caching a query never rewrites the corpus or the rest of the cache. Pending
+    entries are flushed every `flush_every` inserts, on `flush()`, when the cache is
+    garbage-collected, and at exit. The log is compacted down to the live entries
+    once it holds twice as many records.
+
+    Safe to share between threads: one lock guards the entries and counters, and a
+    second serializes writes to the log so lookups never wait on disk.
+    """
+
+    def __init__(self, path=None, max_entries=None, max_bytes=None, ttl=None, flush_every=32):
+        # Absolute, so the at-exit flush still lands here if the working directory changed.
+        self.path = os.path.abspath(path) if path else None
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()  # query -> (float32 embedding, created_at)
+        self._pending = []
+        self._log_records = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._replay()
+        _open_caches.add(self)
+
+    def __del__(self):
+        # A cache dropped before exit still writes the entries it buffered.
+        self.flush()
+
+    def _replay(self):
+        with open(self.path, "r") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Skip a line torn by an interrupted write
+                self._log_records += 1
+                self._insert(record["query"], record["embedding"], record.get("time", 0.0))
+
+    def _expired(self, created_at):
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    @staticmethod
+    def _entry_bytes(query, embedding):
+        return len(query.encode()) + embedding.nbytes
+
+    def _insert(self, query, embedding, created_at):
+        if self._expired(created_at):
+            return None
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._remove(query)
+        self._entries[query] = (embedding, created_at)
+        self.nbytes += self._entry_bytes(query, embedding)
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+        return embedding
+
+    def _remove(self, query):
+        entry = self._entries.pop(query, None)
+        if entry is not None:
+            self.nbytes -= self._entry_bytes(query, entry[0])
+
+    def get(self, query, default=None):
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None or self._expired(entry[1]):
+                self._remove(query)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, query):
+        with self._lock:
+            entry = self._entries.get(query)
+        return entry is not None and not self._expired(entry[1])
+
+    def __getitem__(self, query):
+        embedding = self.get(query)
+        if embedding is None:
+            raise KeyError(query)
+        return embedding
+
+    def __setitem__(self, query, embedding):
+        created_at = time.time()
+        with self._lock:
+            embedding = self._insert(query, embedding, created_at)
+            if embedding is None:
+                return
+            self._pending.append((query, embedding, created_at))
+            full = len(self._pending) >= self.flush_every
+        if full:
+            self.flush()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._entries))
+
+    def update(self, items):
+        for query, embedding in dict(items).items():
+            self[query] = embedding
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def flush(self):
+        if not self.path:
+            return
+        with self._write_lock:
+            # Take the pending records (or, when compacting, every live entry) under the
+            # lock, then write them with only the write lock held.
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, []
+                compact = self._log_records + len(pending) > 2 * max(
+                    len(self._entries), self.flush_every
+                )
+                if compact:
+                    pending = [
+                        (query, embedding, created_at)
+                        for query, (embedding, created_at) in self._entries.items()
+                    ]
+                    self._log_records = len(pending)
+                else:
+                    self._log_records += len(pending)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            lines = "".join(
+                self._record(query, embedding, created_at)
+                for query, embedding, created_at in pending
+            )
+            if compact:
+                self._compact(lines)
+                return
+            # A single append keeps concurrent writers from interleaving partial records.
+            with open(self.path, "a") as file:
+                file.write(lines)
+
+    def _compact(self, lines):
+        """Replace the log with `lines`, the live entries, dropping evicted and stale records."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(lines)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _record(query, embedding, created_at):
+        return (
+            json.dumps({"query": query, "embedding": embedding.tolist(), "time": created_at}) + "\n"
+        )
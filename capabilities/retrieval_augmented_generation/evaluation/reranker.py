@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from anthropic import Anthropic
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "cookbook_reranks.sqlite3")
+
+# Identical for every call, so it is the system prompt; the query and candidates follow.
+INSTRUCTIONS = """You will be given a query and a group of documents, each preceded by its index number in square brackets. Your task is to select only the requested number of documents that are most relevant to help us answer the query.
+
+Output only the indices of the most relevant documents in order of relevance, separated by commas, enclosed in XML tags here:
+<relevant_indices>put the numbers of your indices here, separated by commas</relevant_indices>"""
+
+
+class LLMReranker:
+    """Reorders search results by asking Claude which candidates best answer the query.
+
+    One Anthropic client (and so one pooled HTTP connection pool) serves every call.
+    Decisions are cached in SQLite, keyed by the model, k, the query and the ordered
+    candidate ids, so a repeated eval run reranks nothing it has seen before. The file
+    defaults to `RERANK_CACHE_PATH` or ~/.cache/cookbook_reranks.sqlite3.
+    """
+
+    def __init__(
+        self, model="claude-sonnet-4-5", client=None, cache_path=None, id_field="chunk_link"
+    ):
+        self.model = model
+        self._client = client
+        self.id_field = id_field  # metadata key identifying a candidate in the cache key
+        self.path = cache_path or os.getenv("RERANK_CACHE_PATH", DEFAULT_PATH)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS reranks ("
+                "digest TEXT PRIMARY KEY, ranking TEXT NOT NULL)"
+            )
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+        return self._client
+
+    def _format_candidate(self, i, metadata):
+        return "[{}] Document: {} {} \n {}".format(
+            i, metadata["chunk_heading"], metadata["summary"], metadata["text"]
+        )
+
+    def _digest(self, query, ids, k):
+        return hashlib.sha256(json.dumps([self.model, k, query, ids]).encode()).hexdigest()
+
+    def rerank(self, query, results, k=3):
+        """The k most relevant of `results` (search hits), best first, with a relevance_score.
+
+        If the API call fails the first k results are returned in their original order,
+        and nothing is cached.
+        """
+        ids = [result["metadata"][self.id_field] for result in results]
+        digest = self._digest(query, ids, k)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT ranking FROM reranks WHERE digest = ?", (digest,)
+            ).fetchone()
+        if row is not None:
+            self.hits += 1
+            indices = json.loads(row[0])
+        else:
+            self.misses += 1
+            try:
+                indices = self._choose(query, results, k)
+            except Exception as e:  # noqa: BLE001 - any failure falls back to the search order
+                print(f"An error occurred during reranking: {e}")
+                # Fall back to returning the top k results without reranking
+                return results[:k]
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO reranks (digest, ranking) VALUES (?, ?)",
+                    (digest, json.dumps(indices)),
+                )
+        reranked_results = [dict(results[idx]) for idx in indices]
+        # Assign descending relevance scores; the highest is 100, decreasing by 1 for each rank.
+        for i, result in enumerate(reranked_results):
+            result["relevance_score"] = 100 - i
+        return reranked_results
+
+    def rerank_batch(self, queries, result_lists, k=3, max_workers=8):
+        """rerank() for many queries at once, with up to `max_workers` API calls in flight."""
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(
+                executor.map(lambda args: self.rerank(*args, k=k), zip(queries, result_lists))
+            )
+
+    def _choose(self, query, results, k):
+        """Indices into `results` of the k candidates Claude ranks highest."""
+        candidates = "\n".join(
+            self._format_candidate(i, result["metadata"]) for i, result in enumerate(results)
+        )
+        response = self.client.messages.create(
+            model=self.model,
+            max_tokens=50,
+            system=INSTRUCTIONS,
+            messages=[
+                {
+                    "role": "user",
+                    "content": f"Query: {query}\nSelect the {k} most relevant documents.\n\n"
+                    f"{candidates}",
+                },
+                {"role": "assistant", "content": "<relevant_indices>"},
+            ],
+            temperature=0,
+            stop_sequences=["</relevant_indices>"],
+        )
+        relevant_indices = []
+        for idx in response.content[0].text.strip().split(","):
+            try:
+                relevant_indices.append(int(idx.strip()))
+            except ValueError:
+                continue  # Skip invalid indices
+        # Drop out-of-range and repeated indices, keeping the model's order
+        relevant_indices = [
+            idx for idx in dict.fromkeys(relevant_indices) if 0 <= idx < len(results)
+        ]
+        # If we didn't get any valid indices, fall back to the top k by original order
+        if not relevant_indices:
+            relevant_indices = list(range(min(k, len(results))))
+        return relevant_indices[:k]
@@ -0,0 +1,332 @@
+"""Local HTTP server that loads the retrieval indexes once per host.
+
+promptfoo runs each provider in its own Python worker, so loading the vector
+databases at import time costs one full load (and one in-memory copy) per worker.
+This server imports retrievers.py once and answers
+
+    POST /retrieve_base          {"query": "..."}  ->  {"output": [chunk links]}
+    POST /retrieve_level_two
+    POST /retrieve_level_three
+
+for every worker on the machine. `retrieve()` is the client side: it starts the
+server in the background the first time it finds nothing listening, and then
+waits for it. Run `python retrieval_server.py` to start it by hand instead.
+The address comes from RETRIEVAL_SERVER_HOST and RETRIEVAL_SERVER_PORT.
+
+    GET /health      ->  {"ready": ..., "pid": ..., "fingerprint": {...}}
+    POST /shutdown   {"pid": ...}  stops the server (only that process, if given)
+
+The fingerprint names the checkout, a hash of its Python code and the source
+data's modification times. Before its first query, the client compares it with
+its own and restarts a server that is serving other code or data. The server
+also exits after RETRIEVAL_SERVER_IDLE_TIMEOUT seconds (default 1800) without a
+request, and `python retrieval_server.py --stop` stops it by hand.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LOG_PATH = os.path.normpath(os.path.join(HERE, "..", "data", "retrieval_server.log"))
+HOST = os.environ.get("RETRIEVAL_SERVER_HOST", "127.0.0.1")
+PORT = int(os.environ.get("RETRIEVAL_SERVER_PORT", "8765"))
+IDLE_TIMEOUT = float(os.environ.get("RETRIEVAL_SERVER_IDLE_TIMEOUT", "1800"))
+ROUTES = ("retrieve_base", "retrieve_level_two", "retrieve_level_three")
+# The files retrievers.py builds its vector databases from.
+SOURCES = ("anthropic_docs.json", "anthropic_summary_indexed_docs.json")
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+class RetrievalServer:
+    """Serves `routes` (name -> function of one query string) as JSON POST endpoints.
+
+    `load` builds the routes; it runs in a thread after the socket is bound, so
+    clients can connect straight away and their requests wait until it finishes.
+    `fingerprint` is reported by /health. The server stops on POST /shutdown, or
+    once `idle_timeout` seconds pass with no request in flight or arriving.
+    """
+
+    def __init__(self, load, host=HOST, port=PORT, fingerprint=None, idle_timeout=None):
+        self.load = load
+        self.host = host
+        self.port = port
+        self.fingerprint = fingerprint or {}
+        self.idle_timeout = idle_timeout
+        self.routes = None
+        self._ready = None
+        self._stopping = None
+        self._active = 0
+        self._last_request = 0.0
+
+    async def serve(self, started=None):
+        """Bind, load the routes, then serve until stopped.
+
+        Sets the threading.Event `started` once bound. A shutdown requested while the
+        routes are loading takes effect when loading finishes.
+        """
+        self._ready = asyncio.Event()
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]  # the real port when 0 was asked for
+        if started is not None:
+            started.set()
+        async with server:
+            self.routes = await asyncio.to_thread(self.load)
+            self._ready.set()
+            self._last_request = asyncio.get_running_loop().time()
+            watcher = asyncio.create_task(self._stop_when_idle())
+            try:
+                await self._stopping.wait()
+            finally:
+                watcher.cancel()
+
+    async def _stop_when_idle(self):
+        if not self.idle_timeout:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            idle = loop.time() - self._last_request
+            if not self._active and idle >= self.idle_timeout:
+                print(f"No requests for {self.idle_timeout:.0f}s; stopping.", flush=True)
+                self._stopping.set()
+                return
+            await asyncio.sleep(max(self.idle_timeout - idle, 0) + 0.05)
+
+    async def _handle(self, reader, writer):
+        self._active += 1
+        try:
+            status, payload = await self._respond(reader)
+        except (ValueError, AttributeError, EOFError) as e:
+            status, payload = 400, {"error": f"Malformed request: {e}"}
+        finally:
+            self._active -= 1
+            self._last_request = asyncio.get_running_loop().time()
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+        writer.close()
+
+    async def _respond(self, reader):
+        method, path, _ = (await reader.readline()).decode().split(" ", 2)
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        if (method, path) == ("GET", "/health"):
+            return 200, {
+                "ready": self._ready.is_set(),
+                "pid": os.getpid(),
+                "fingerprint": self.fingerprint,
+            }
+        if (method, path) == ("POST", "/shutdown"):
+            pid = json.loads(body or "{}").get("pid")
+            if pid not in (None, os.getpid()):
+                return 400, {"error": f"This server is process {os.getpid()}, not {pid}."}
+            self._stopping.set()
+            return 200, {"output": "stopping", "pid": os.getpid()}
+        await self._ready.wait()
+        function = self.routes.get(path.strip("/")) if method == "POST" else None
+        if function is None:
+            return 404, {"error": f"No endpoint {method} {path}."}
+        try:
+            # Searches are thread-safe, and reranking waits on the API, so requests overlap.
+            output = await asyncio.to_thread(function, json.loads(body)["query"])
+        except Exception as e:  # noqa: BLE001 - a failing retriever is reported to its client
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        return 200, {"output": output}
+
+
+def _load_retrievers():
+    import retrievers
+
+    return {name: getattr(retrievers, name) for name in ROUTES}
+
+
+def fingerprint():
+    """This checkout's path, a hash of its Python code and its source data's mtimes."""
+    code = hashlib.sha256()
+    for name in sorted(os.listdir(HERE)):
+        if name.endswith(".py"):
+            with open(os.path.join(HERE, name), "rb") as file:
+                code.update(name.encode() + b"\0" + file.read())
+    data_dir = os.path.dirname(LOG_PATH)
+    sources = {}
+    for name in SOURCES:
+        path = os.path.join(data_dir, name)
+        sources[name] = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    return {"root": HERE, "code": code.hexdigest(), "sources": sources}
+
+
+def _post(route, query, host, port):
+    return _request(f"http://{host}:{port}/{route}", {"query": query})["output"]
+
+
+def _open(url, payload=None):
+    """GET `url`, or POST `payload` to it as JSON, and decode the JSON reply."""
+    request = urllib.request.Request(
+        url,
+        data=None if payload is None else json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+def _request(url, payload=None):
+    """_open(), raising RuntimeError with the server's message if the request fails."""
+    try:
+        return _open(url, payload)
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"Retrieval server error: {json.load(e)['error']}") from None
+    except ConnectionResetError:
+        # The server exits if loading the indexes fails, dropping the waiting requests.
+        raise RuntimeError(f"Retrieval server closed the connection; see {LOG_PATH}.") from None
+
+
+def _start_server(host, port):
+    """Launch this module as a detached server process that logs to LOG_PATH."""
+    with open(LOG_PATH, "a") as log:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--host", host, "--port", str(port)],
+            cwd=HERE,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+
+def _reason(error):
+    return error.reason if isinstance(error, urllib.error.URLError) else error
+
+
+def _refused(error):
+    """Whether `error` means nothing is listening."""
+    return isinstance(_reason(error), ConnectionRefusedError)
+
+
+def _reset(error):
+    """Whether `error` means the server dropped the connection, as one that is closing does."""
+    return isinstance(_reason(error), ConnectionResetError)
+
+
+def _health(host, port, timeout=30.0):
+    """The /health reply of the server on host:port, or None if nothing is listening.
+
+    A server that drops the request is closing, so it is asked again until it has
+    gone or been replaced.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return _open(f"http://{host}:{port}/health")
+        except (urllib.error.URLError, ConnectionResetError) as e:
+            if _refused(e):
+                return None
+            if not _reset(e) or time.monotonic() > deadline:
+                raise
+        time.sleep(0.1)
+
+
+def stop(host=HOST, port=PORT, pid=None, timeout=30.0):
+    """Ask the server on host:port (only process `pid`, if given) to exit, and wait for it.
+
+    Returns once that process no longer answers, even if a new server has taken the
+    port meanwhile. Returns False if there was nothing to stop: nothing listening, or
+    another process answering in place of `pid`.
+    """
+    try:
+        pid = _open(f"http://{host}:{port}/shutdown", {"pid": pid})["pid"]
+    except urllib.error.HTTPError as e:
+        if e.code == 400 and pid is not None:
+            return False  # `pid` has exited and another server holds the port
+        raise RuntimeError(f"Retrieval server error: {json.load(e)['error']}") from None
+    except (urllib.error.URLError, ConnectionResetError) as e:
+        if _refused(e):
+            return False
+        if not _reset(e):
+            raise
+        # Already closing: another client's shutdown reached it first.
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        health = _health(host, port, timeout=max(deadline - time.monotonic(), 0))
+        if health is None or (pid is not None and health["pid"] != pid):
+            return True
+        time.sleep(0.1)
+    raise RuntimeError(f"Retrieval server on {host}:{port} did not stop.")
+
+
+_checked = set()  # (host, port) whose server this process has compared fingerprints with
+
+
+def _restart_if_stale(host, port):
+    """Stop the server on host:port if it serves another checkout's code or data.
+
+    Checked once per process. Workers starting together may all find the same stale
+    server; the shutdown names its pid, so whichever request lands first stops it,
+    the rest find it closing or already replaced, and none stops a fresh server.
+    """
+    if (host, port) in _checked:
+        return
+    health = _health(host, port)
+    if health is not None and health.get("fingerprint") != fingerprint():
+        print(f"Restarting the retrieval server on {host}:{port}: its code or data changed.")
+        stop(host, port, pid=health["pid"])
+    _checked.add((host, port))
+
+
+def retrieve(route, query, host=HOST, port=PORT, autostart=True, startup_timeout=60.0):
+    """Chunk links for `query` from the server's `route`, starting the server if needed.
+
+    With `autostart`, a server started from other code or data is replaced first (see
+    fingerprint()). Several workers may race to start it; the losers fail to bind and
+    exit, and every client connects to the winner. `startup_timeout` only covers
+    binding the socket; index loading happens while the first requests wait.
+    """
+    if autostart:
+        _restart_if_stale(host, port)
+    deadline = None
+    while True:
+        try:
+            return _post(route, query, host, port)
+        except urllib.error.URLError as e:
+            if not isinstance(e.reason, ConnectionRefusedError) or not autostart:
+                raise
+        if deadline is None:
+            _start_server(host, port)
+            deadline = time.monotonic() + startup_timeout
+        elif time.monotonic() > deadline:
+            raise RuntimeError(f"Retrieval server did not start on {host}:{port}.")
+        time.sleep(0.2)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT, help="seconds")
+    parser.add_argument("--stop", action="store_true", help="stop the running server")
+    args = parser.parse_args()
+    if args.stop:
+        stopped = stop(args.host, args.port)
+        print("Stopped." if stopped else f"No server on {args.host}:{args.port}.")
+    else:
+        server = RetrievalServer(
+            _load_retrievers, args.host, args.port, fingerprint(), args.idle_timeout
+        )
+        asyncio.run(server.serve())
@@ -0,0 +1,43 @@
+"""The three retrieval methods from guide.ipynb, each returning the top chunk links.
+
+Served by retrieval_server.py. Each vector database is loaded on first use, and
+levels two and three share the one summary-indexed store.
+"""
+
+from reranker import LLMReranker
+from vectordb import SummaryIndexedVectorDB, VectorDB, load_shared
+
+# One client and one cache of rerank decisions for every level-three request.
+reranker = LLMReranker(model="claude-sonnet-4-5")
+
+
+def _docs_db():
+    return load_shared(VectorDB, "anthropic_docs", "../data/anthropic_docs.json")
+
+
+def _summary_db():
+    return load_shared(
+        SummaryIndexedVectorDB,
+        "anthropic_docs_summaries",
+        "../data/anthropic_summary_indexed_docs.json",
+    )
+
+
+def retrieve_base(query):
+    results = _docs_db().search(query, k=3)
+    return [result["metadata"]["chunk_link"] for result in results]
+
+
+def retrieve_level_two(query):
+    results = _summary_db().search(query, k=3)
+    return [result["metadata"]["chunk_link"] for result in results]
+
+
+def retrieve_level_three(query):
+    # Step 1: Get initial results from the summary db
+    initial_results = _summary_db().search(query, k=20)
+
+    # Step 2: Re-rank results
+    reranked_results = reranker.rerank(query, initial_results, k=3)
+
+    return [result["metadata"]["chunk_link"] for result in reranked_results]
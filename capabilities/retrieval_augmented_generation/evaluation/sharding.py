@@ -0,0 +1,89 @@
+"""Exact search fanned out over worker processes that share one memory-mapped matrix.
+
+Each worker opens the embedding .npy with np.memmap, so all of them read the same
+page-cache pages and nothing is copied per process. A query batch is sent to every
+shard (a contiguous block of rows), each shard returns its local top-k, and the
+parent merges them. Workers notice a rewritten file (compaction, appended rows) by
+its inode, size and mtime and reopen it.
+
+Where processes are spawned rather than forked (macOS, Windows), scripts that search
+a sharded store must guard their entry point with `if __name__ == "__main__":`.
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from indexes import _top_k
+
+_matrices = {}  # per worker process: path -> (file stamp, memmap)
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _open(path, stamp):
+    cached = _matrices.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = _matrices[path] = (stamp, np.load(path, mmap_mode="r"))
+    return cached[1]
+
+
+def _scan_shard(path, stamp, start, stop, queries, k, similarity_threshold, deleted):
+    """Top-k (global row ids, similarities) per query within rows [start, stop)."""
+    similarities = queries @ _open(path, stamp)[start:stop].T
+    local_deleted = deleted[(deleted >= start) & (deleted < stop)] - start
+    similarities[:, local_deleted] = -np.inf
+    results = []
+    for row in similarities:
+        candidates = np.flatnonzero(row >= similarity_threshold)
+        top = candidates[_top_k(row[candidates], k)]
+        results.append((top + start, row[top]))
+    return results
+
+
+class ShardedScanner:
+    """Exact top-k over an .npy embedding matrix split across `n_shards` processes."""
+
+    def __init__(self, n_shards=None, block_size=256):
+        self.n_shards = n_shards or os.cpu_count()
+        self.block_size = block_size  # queries sent per round, bounding shard memory
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_shards)
+        return self._pool
+
+    def search(self, path, n_rows, queries, k, similarity_threshold, deleted=None):
+        """Yield (row ids, similarities) of each query's top-k rows, best first."""
+        stamp = _file_stamp(path)
+        deleted = np.empty(0, dtype=np.int64) if deleted is None else deleted
+        bounds = np.linspace(0, n_rows, self.n_shards + 1).astype(int)
+        shards = [(start, stop) for start, stop in itertools.pairwise(bounds) if stop > start]
+        if not shards:
+            for _ in queries:
+                yield np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            return
+        for i in range(0, len(queries), self.block_size):
+            block = np.ascontiguousarray(queries[i : i + self.block_size])
+            futures = [
+                self._executor().submit(
+                    _scan_shard, path, stamp, start, stop, block, k, similarity_threshold, deleted
+                )
+                for start, stop in shards
+            ]
+            shard_results = [future.result() for future in futures]
+            for per_query in zip(*shard_results):
+                ids = np.concatenate([ids for ids, _ in per_query])
+                scores = np.concatenate([scores for _, scores in per_query])
+                top = _top_k(scores, k)
+                yield ids[top], scores[top]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,60 @@
+"""
+Unit tests for the batch retrieval evaluator.
+"""
+
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+from batch_eval import evaluate, retrieval_metrics
+from eval_retrieval import evaluate_retrieval
+
+
+class TestBatchEval(unittest.TestCase):
+    """Test cases comparing the vectorized metrics with eval_retrieval.py."""
+
+    def test_metrics_match_per_row_evaluation(self):
+        """Test that every metric equals evaluate_retrieval on random cases."""
+        rng = random.Random(0)
+        links = [f"link-{i}" for i in range(12)]
+        correct = [rng.sample(links, rng.randint(0, 3)) for _ in range(200)]
+        retrieved = [rng.choices(links, k=rng.randint(0, 5)) for _ in range(200)]
+        metrics = retrieval_metrics(retrieved, correct)
+        for i, (got, expected) in enumerate(zip(retrieved, correct)):
+            precision, recall, mrr, f1 = evaluate_retrieval(got, repr(expected))
+            self.assertAlmostEqual(metrics["precision"][i], precision)
+            self.assertAlmostEqual(metrics["recall"][i], recall)
+            self.assertAlmostEqual(metrics["f1"][i], f1)
+            self.assertAlmostEqual(metrics["mrr"][i], mrr)
+
+    def test_all_empty_retrievals_score_zero(self):
+        """Test that a retriever returning nothing scores zero everywhere."""
+        metrics = retrieval_metrics([[], []], [["a"], ["b"]])
+        for values in metrics.values():
+            self.assertEqual(values.tolist(), [0.0, 0.0])
+
+    def test_evaluate_writes_columns(self):
+        """Test a full run with a stand-in retriever and its saved columns."""
+        with tempfile.TemporaryDirectory() as test_dir:
+            dataset_path = os.path.join(test_dir, "dataset.json")
+            output = os.path.join(test_dir, "results.npz")
+            dataset = [
+                {"id": "q1", "question": "alpha", "correct_chunks": ["alpha", "x"]},
+                {"id": "q2", "question": "beta", "correct_chunks": ["y"]},
+            ]
+            with open(dataset_path, "w") as f:
+                json.dump(dataset, f)
+            averages = evaluate(lambda query: [query, "z"], dataset_path, output)
+            results = np.load(output)
+            self.assertEqual(results["id"].tolist(), ["q1", "q2"])
+            self.assertEqual(results["precision"].tolist(), [0.5, 0.0])
+            self.assertEqual(json.loads(results["retrieved"][1]), ["beta", "z"])
+        self.assertEqual(averages["average_recall"], 0.25)
+        self.assertEqual(averages["average_mrr"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Unit tests for the vector store benchmark.
+"""
+
+import unittest
+
+from benchmark import compare, run, scale_corpus
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test cases for corpus scaling, the benchmark run and regression checks."""
+
+    def test_scaled_copies_are_distinct(self):
+        """Test that every copy gets its own id and perturbed text."""
+        items = [
+            {"chunk_link": f"doc-{i}", "text": f"chunk {i} about prompt caching and tool use"}
+            for i in range(5)
+        ]
+        scaled = scale_corpus(items, 4, "chunk_link")
+        self.assertEqual(scaled[:5], items)
+        self.assertEqual(len({item["chunk_link"] for item in scaled}), 20)
+        self.assertEqual(scaled[5]["chunk_link"], "doc-0#1")
+        self.assertGreater(len({item["text"] for item in scaled}), 15)
+
+    def test_run_measures_every_index(self):
+        """Test that a small run reports one full result per index, with exact recall 1."""
+        results = run(
+            ["classification"], [1], ["exact", "ivf", "binary"], dim=64, n_queries=5, rounds=1
+        )
+        self.assertEqual([r["index"] for r in results], ["exact", "ivf", "binary"])
+        for result in results:
+            self.assertEqual(result["n_chunks"], 68)
+            self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p99"])
+            self.assertGreater(result["qps"], 0)
+            self.assertGreater(result["peak_rss_mb"], 0)
+        self.assertEqual(results[0]["recall_at_10"], 1.0)
+
+    def test_compare_flags_only_changes_beyond_tolerance(self):
+        """Test that slower latency, lower QPS and lost recall are reported."""
+        baseline = {
+            "corpus": "rag",
+            "scale": 1,
+            "index": "ivf",
+            "latency_ms": {"p50": 1.0, "p95": 2.0, "p99": 3.0},
+            "qps": 1000.0,
+            "recall_at_10": 0.95,
+        }
+        noisy = {**baseline, "latency_ms": {"p50": 1.1, "p95": 2.2, "p99": 3.3}, "qps": 900.0}
+        self.assertEqual(compare([noisy], [baseline]), [])
+        slower = {
+            **baseline,
+            "latency_ms": {"p50": 1.0, "p95": 2.0, "p99": 6.0},
+            "qps": 500.0,
+            "recall_at_10": 0.90,
+        }
+        regressions = compare([slower], [baseline])
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith("rag 1x ivf: p99 latency"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Unit tests for the embedding pipeline's retries, pacing, concurrency and checkpoints.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import voyageai.error
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline, TokenBucket
+
+# The module's own time.sleep is patched in the tests; the embedder's delays are real.
+_sleep = time.sleep
+
+
+def rate_limited(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after is not None else None
+    return voyageai.error.RateLimitError("slow down", http_status=429, headers=headers)
+
+
+class ScriptedEmbedder:
+    """Embeds each text as [len(text)], raising scripted errors for batches first.
+
+    `failures` maps a batch's first text to the errors its successive calls raise.
+    Every call is recorded, and the most calls ever in flight at once is tracked.
+    """
+
+    model = "scripted"
+    cacheable = True
+
+    def __init__(self, failures=None, delay=0.0):
+        self.failures = {text: list(errors) for text, errors in (failures or {}).items()}
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            errors = self.failures.get(texts[0])
+            error = errors.pop(0) if errors else None
+        try:
+            _sleep(self.delay)
+            if error is not None:
+                raise error
+            return [[float(len(text))] for text in texts]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class TestEmbeddingPipeline(unittest.TestCase):
+    """Test cases for retries, backoff, pacing, concurrency and partial failures."""
+
+    def setUp(self):
+        # Backoff sleeps are recorded rather than slept.
+        patcher = mock.patch("embedding_pipeline.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_throttling_and_server_errors_are_retried(self):
+        """Test that 429 and 5xx failures are retried until the batch succeeds."""
+        unavailable = voyageai.error.ServiceUnavailableError("down", http_status=503)
+        embedder = ScriptedEmbedder({"a": [rate_limited(), unavailable]})
+        embeddings = EmbeddingPipeline(batch_size=2).embed(embedder, ["a", "bb", "ccc"])
+        self.assertEqual(embeddings, [[1.0], [2.0], [3.0]])
+        self.assertEqual(embedder.calls.count(["a", "bb"]), 3)
+
+    def test_client_errors_are_not_retried(self):
+        """Test that a 4xx other than 429 fails at once."""
+        invalid = voyageai.error.InvalidRequestError("too long", http_status=400)
+        embedder = ScriptedEmbedder({"a": [invalid]})
+        with self.assertRaises(voyageai.error.InvalidRequestError):
+            EmbeddingPipeline().embed(embedder, ["a"])
+        self.assertEqual(len(embedder.calls), 1)
+        self.sleep.assert_not_called()
+
+    def test_retries_give_up_after_max_retries(self):
+        """Test that a batch failing every attempt raises after max_retries retries."""
+        embedder = ScriptedEmbedder({"a": [rate_limited() for _ in range(5)]})
+        with self.assertRaises(voyageai.error.RateLimitError):
+            EmbeddingPipeline(max_retries=2).embed(embedder, ["a"])
+        self.assertEqual(len(embedder.calls), 3)
+
+    def test_retry_after_header_sets_the_delay(self):
+        """Test that Retry-After is honoured, capped at max_delay."""
+        embedder = ScriptedEmbedder({"a": [rate_limited("7"), rate_limited("600")]})
+        EmbeddingPipeline(max_delay=60.0).embed(embedder, ["a"])
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [7.0, 60.0])
+
+    def test_backoff_is_full_jitter_and_capped(self):
+        """Test that delays without Retry-After stay within base * 2**attempt and max_delay."""
+        pipeline = EmbeddingPipeline(base_delay=1.0, max_delay=10.0)
+        for attempt in range(8):
+            delays = [pipeline._backoff(attempt, rate_limited()) for _ in range(50)]
+            self.assertGreaterEqual(min(delays), 0.0)
+            self.assertLessEqual(max(delays), min(10.0, 2**attempt))
+
+    def test_in_flight_batches_are_bounded(self):
+        """Test that at most max_in_flight batches run at once and order is kept."""
+        embedder = ScriptedEmbedder(delay=0.02)
+        texts = ["x" * i for i in range(1, 25)]
+        embeddings = EmbeddingPipeline(batch_size=2, max_in_flight=3).embed(embedder, texts)
+        self.assertEqual(embeddings, [[float(len(text))] for text in texts])
+        self.assertEqual(embedder.max_in_flight, 3)
+
+    def test_token_bucket_paces_requests(self):
+        """Test that requests beyond the burst capacity wait for the refill rate."""
+        self.sleep.side_effect = _sleep
+        bucket = TokenBucket(rate=100, capacity=5)
+        start = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_finished_batches_are_checkpointed_before_the_error(self):
+        """Test that a failed run keeps every other batch, so a rerun embeds only the rest."""
+        self.sleep.side_effect = _sleep
+        invalid = voyageai.error.InvalidRequestError("bad batch", http_status=400)
+        texts = [f"text {i}" for i in range(12)]
+        embedder = ScriptedEmbedder({"text 2": [invalid]}, delay=0.01)
+        pipeline = EmbeddingPipeline(batch_size=2, max_in_flight=3)
+        checkpointed = []
+        with self.assertRaises(voyageai.error.InvalidRequestError):
+            pipeline.embed(embedder, texts, on_batch=lambda batch, _: checkpointed.extend(batch))
+        submitted = {text for call in embedder.calls for text in call}
+        self.assertEqual(set(checkpointed), submitted - {"text 2", "text 3"})
+
+        with tempfile.TemporaryDirectory() as test_dir:
+            cache = EmbeddingCache(os.path.join(test_dir, "embeddings.sqlite3"))
+            embedder = ScriptedEmbedder({"text 2": [invalid]}, delay=0.01)
+            with self.assertRaises(voyageai.error.InvalidRequestError):
+                cache.embed(embedder, texts, pipeline=pipeline)
+            resumed = ScriptedEmbedder()
+            embeddings = cache.embed(resumed, texts, pipeline=pipeline)
+            self.assertEqual([e.tolist() for e in embeddings], [[6.0]] * 10 + [[7.0]] * 2)
+            self.assertNotIn(["text 0", "text 1"], resumed.calls)
+            self.assertIn(["text 2", "text 3"], resumed.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Unit tests for the cached LLM reranker, against a stand-in for the Anthropic client.
+"""
+
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from reranker import INSTRUCTIONS, LLMReranker
+
+
+class FakeMessages:
+    """Answers every request with a fixed completion and records the requests."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.requests = []
+
+    def create(self, **request):
+        self.requests.append(request)
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return SimpleNamespace(content=[SimpleNamespace(text=self.answer)])
+
+
+def make_results(n):
+    return [
+        {
+            "metadata": {
+                "chunk_link": f"https://docs.example.com/{i}",
+                "chunk_heading": f"Heading {i}",
+                "summary": f"Summary {i}",
+                "text": f"Text {i}",
+            },
+            "similarity": 1 - i / 100,
+        }
+        for i in range(n)
+    ]
+
+
+class TestLLMReranker(unittest.TestCase):
+    """Test cases for rerank parsing, caching and fallbacks."""
+
+    def setUp(self):
+        self.test_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.test_dir.cleanup)
+        self.results = make_results(6)
+
+    def make_reranker(self, answer):
+        messages = FakeMessages(answer)
+        reranker = LLMReranker(
+            client=SimpleNamespace(messages=messages),
+            cache_path=os.path.join(self.test_dir.name, "reranks.sqlite3"),
+        )
+        return reranker, messages
+
+    def links(self, results):
+        return [int(result["metadata"]["chunk_link"].rsplit("/", 1)[1]) for result in results]
+
+    def test_parses_indices_in_model_order(self):
+        """Test that valid indices are kept in order and junk or repeats are dropped."""
+        reranker, _ = self.make_reranker(" 4, x, 2, 4, 99, 0")
+        reranked = reranker.rerank("query", self.results, k=3)
+        self.assertEqual(self.links(reranked), [4, 2, 0])
+        self.assertEqual([r["relevance_score"] for r in reranked], [100, 99, 98])
+        self.assertNotIn("relevance_score", self.results[4])
+
+    def test_repeated_rerank_is_cached(self):
+        """Test that the same query and candidates call the API once, across instances."""
+        reranker, messages = self.make_reranker("5, 1")
+        first = reranker.rerank("query", self.results, k=2)
+        second = reranker.rerank("query", self.results, k=2)
+        self.assertEqual(first, second)
+        self.assertEqual(len(messages.requests), 1)
+        reopened, reopened_messages = self.make_reranker("0, 1")
+        self.assertEqual(self.links(reopened.rerank("query", self.results, k=2)), [5, 1])
+        self.assertEqual(reopened_messages.requests, [])
+        reranker.rerank("query", self.results[::-1], k=2)
+        self.assertEqual(len(messages.requests), 2)
+
+    def test_instructions_are_the_system_prompt(self):
+        """Test that the shared instructions are sent apart from the query."""
+        reranker, messages = self.make_reranker("0")
+        reranker.rerank("what is prompt caching", self.results, k=1)
+        self.assertEqual(messages.requests[0]["system"], INSTRUCTIONS)
+        self.assertIn("what is prompt caching", messages.requests[0]["messages"][0]["content"])
+
+    def test_api_error_falls_back_uncached(self):
+        """Test that failures return the original top k and are retried next time."""
+        reranker, messages = self.make_reranker(RuntimeError("overloaded"))
+        self.assertEqual(reranker.rerank("query", self.results, k=2), self.results[:2])
+        reranker.rerank("query", self.results, k=2)
+        self.assertEqual(len(messages.requests), 2)
+
+    def test_rerank_batch_matches_rerank(self):
+        """Test that batch mode returns one reranked list per query, in order."""
+        reranker, _ = self.make_reranker("3, 2")
+        queries = [f"query {i}" for i in range(5)]
+        batched = reranker.rerank_batch(queries, [self.results] * 5, k=2)
+        self.assertEqual([self.links(results) for results in batched], [[3, 2]] * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
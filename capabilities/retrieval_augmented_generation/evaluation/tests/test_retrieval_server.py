@@ -0,0 +1,163 @@
+"""
+Unit tests for the local retrieval server and its client.
+"""
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+import retrieval_server
+from retrieval_server import RetrievalServer, retrieve
+
+# A server from "other code" in its own process, so it has a pid of its own; prints its port.
+STALE_SERVER = """
+import asyncio, threading, retrieval_server
+server = retrieval_server.RetrievalServer(dict, port=0, fingerprint={"code": "old"})
+started = threading.Event()
+report = lambda: (started.wait(), print(server.port, flush=True))
+threading.Thread(target=report).start()
+asyncio.run(server.serve(started))
+"""
+
+
+class TestRetrievalServer(unittest.TestCase):
+    """Test cases against a server whose routes are plain functions."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start one server on a free port in a background event loop."""
+
+        def load():
+            cls.loads += 1
+            return {"echo": lambda query: [query, query.upper()], "fail": lambda query: 1 / 0}
+
+        cls.loads = 0
+        cls.server = RetrievalServer(load, port=0)
+        cls.loop = asyncio.new_event_loop()
+        threading.Thread(target=cls.loop.run_forever, daemon=True).start()
+        started = threading.Event()
+        cls.serving = asyncio.run_coroutine_threadsafe(cls.server.serve(started), cls.loop)
+        started.wait()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the server and its event loop."""
+        cls.serving.cancel()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+
+    def start(self, port=0, **kwargs):
+        """Another server (on a free port by default), returning it and its serve() future."""
+        server = RetrievalServer(dict, port=port, **kwargs)
+        started = threading.Event()
+        serving = asyncio.run_coroutine_threadsafe(server.serve(started), self.loop)
+        started.wait()
+        return server, serving
+
+    def request(self, route, query):
+        return retrieve(route, query, port=self.server.port, autostart=False)
+
+    def test_route_returns_output(self):
+        """Test that a route's return value comes back as the output."""
+        self.assertEqual(self.request("echo", "query"), ["query", "QUERY"])
+
+    def test_routes_load_once(self):
+        """Test that many requests share one load."""
+        for i in range(5):
+            self.request("echo", str(i))
+        self.assertEqual(self.loads, 1)
+
+    def test_errors_are_raised_by_the_client(self):
+        """Test that unknown routes and failing retrievers raise RuntimeError."""
+        with self.assertRaisesRegex(RuntimeError, "No endpoint"):
+            self.request("missing", "query")
+        with self.assertRaisesRegex(RuntimeError, "ZeroDivisionError"):
+            self.request("fail", "query")
+
+    def test_malformed_request_is_rejected(self):
+        """Test that a request that is not HTTP gets a 400 and the server keeps serving."""
+        with socket.create_connection(("127.0.0.1", self.server.port)) as connection:
+            connection.sendall(b"garbage\r\n\r\n")
+            reply = connection.makefile("rb").read()
+        self.assertTrue(reply.startswith(b"HTTP/1.1 400 Bad Request"))
+        self.assertIn(b"Malformed request", reply)
+        self.assertEqual(self.request("echo", "next"), ["next", "NEXT"])
+
+    def test_health_reports_fingerprint(self):
+        """Test that /health answers with the pid and the server's fingerprint."""
+        server, serving = self.start(fingerprint={"code": "abc"})
+        health = retrieval_server._request(f"http://127.0.0.1:{server.port}/health")
+        self.assertEqual(health["fingerprint"], {"code": "abc"})
+        self.assertEqual(health["pid"], os.getpid())
+        self.assertTrue(retrieval_server.stop(port=server.port))
+        serving.result(timeout=5)
+
+    def test_shutdown_checks_the_pid(self):
+        """Test that a shutdown naming another process leaves the server running."""
+        self.assertFalse(retrieval_server.stop(port=self.server.port, pid=1))
+        self.assertEqual(self.request("echo", "still up"), ["still up", "STILL UP"])
+
+    def test_idle_server_stops(self):
+        """Test that a server with no requests exits after its idle timeout."""
+        _, serving = self.start(idle_timeout=0.2)
+        serving.result(timeout=5)
+
+    def test_stale_server_is_restarted(self):
+        """Test that the client stops a server whose fingerprint differs from its own."""
+        current, serving_current = self.start(fingerprint=retrieval_server.fingerprint())
+        retrieval_server._restart_if_stale("127.0.0.1", current.port)
+        self.assertFalse(serving_current.done())
+        stale, serving_stale = self.start(fingerprint={"code": "old"})
+        retrieval_server._restart_if_stale("127.0.0.1", stale.port)
+        serving_stale.result(timeout=5)
+        retrieval_server.stop(port=current.port)
+        serving_current.result(timeout=5)
+
+    def test_workers_starting_together_replace_a_stale_server(self):
+        """Test that many processes finding one stale server all go on without errors.
+
+        The first shutdown stops it, and a fresh server takes the port while the other
+        workers' requests are still landing on the closing or the new server.
+        """
+        stale = subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                STALE_SERVER,
+            ],
+            cwd=retrieval_server.HERE,
+            stdout=subprocess.PIPE,
+        )
+        port = int(stale.stdout.readline())
+        start_at = time.time() + 1.0
+        worker = (
+            "import time, retrieval_server\n"
+            f"time.sleep(max({start_at} - time.time(), 0))\n"
+            f"retrieval_server._restart_if_stale('127.0.0.1', {port})\n"
+        )
+        workers = [
+            subprocess.Popen(
+                [sys.executable, "-c", worker],
+                cwd=retrieval_server.HERE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+            )
+            for _ in range(12)
+        ]
+        stale.wait(timeout=30)
+        stale.stdout.close()
+        fresh, serving_fresh = self.start(port=port, fingerprint=retrieval_server.fingerprint())
+        for process in workers:
+            _, stderr = process.communicate(timeout=60)
+            self.assertEqual(process.returncode, 0, stderr.decode())
+        self.assertFalse(serving_fresh.done())
+        retrieval_server.stop(port=fresh.port)
+        serving_fresh.result(timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,682 @@
+"""
+Unit tests for the RAG evaluation VectorDB.
+
+Run from the evaluation directory (python -m pytest tests). Everything is embedded
+with the offline HashingEmbedder, so no API key or network access is needed.
+"""
+
+import gc
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+import vectordb
+from bitmap_index import BitmapIndex
+from bm25 import BM25Index, fuse_rrf, tokenize
+from dedup import MinHasher, near_duplicate_groups
+from embedders import Embedder, HashingEmbedder
+from embedding_cache import EmbeddingCache
+from indexes import HNSWIndex, IVFIndex
+from quantization import BinaryIndex, PQIndex, ProjectionIndex, ScalarQuantizedIndex
+from query_cache import QueryCache
+from vectordb import SummaryIndexedVectorDB, VectorDB, load_shared
+
+TOPICS = ["billing", "prompt caching", "tool use", "vision", "streaming", "batch api"]
+
+
+def make_docs(n):
+    return [
+        {
+            "chunk_link": f"https://docs.example.com/{i}",
+            "chunk_heading": f"{TOPICS[i % len(TOPICS)].title()} section {i}",
+            "text": f"How {TOPICS[i % len(TOPICS)]} works, part {i}. " * 3,
+            "summary": f"Summary of {TOPICS[i % len(TOPICS)]} part {i}.",
+        }
+        for i in range(n)
+    ]
+
+
+class CountingEmbedder(HashingEmbedder):
+    """HashingEmbedder that records how many texts it was asked to embed."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+class TestHashingEmbedder(unittest.TestCase):
+    """Test suite for the deterministic offline embedder."""
+
+    def test_deterministic_and_normalized(self):
+        """Test that the same text always maps to the same unit vector."""
+        first = HashingEmbedder(dim=64).embed(["hello world", "hello world"])
+        second = HashingEmbedder(dim=64).embed(["hello world"])
+        self.assertEqual(first[0].shape, (64,))
+        np.testing.assert_array_equal(first[0], second[0])
+        self.assertAlmostEqual(float(np.linalg.norm(first[0])), 1.0, places=5)
+
+    def test_similar_texts_score_higher(self):
+        """Test that shared substrings produce higher cosine similarity."""
+        base, close, far = HashingEmbedder().embed(
+            ["prompt caching reduces latency", "prompt caching cuts latency", "vision inputs"]
+        )
+        self.assertGreater(base @ close, base @ far)
+
+    def test_embedder_without_embed_cannot_be_built(self):
+        """Test that a misconfigured embedder fails at construction, not at first search."""
+
+        class Unfinished(Embedder):
+            model = "unfinished"
+
+        with self.assertRaises(TypeError):
+            Unfinished()
+
+    def test_seed_and_dim_change_model(self):
+        """Test that the model name identifies the vector space."""
+        self.assertNotEqual(HashingEmbedder(dim=64).model, HashingEmbedder(dim=128).model)
+        self.assertNotEqual(HashingEmbedder(seed=1).model, HashingEmbedder(seed=2).model)
+
+
+class TestQueryCache(unittest.TestCase):
+    """Test suite for the bounded, log-backed query-embedding cache."""
+
+    def setUp(self):
+        test_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(test_dir.cleanup)
+        self.path = os.path.join(test_dir.name, "queries.jsonl")
+
+    def test_least_recently_used_is_evicted_first(self):
+        """Test that a lookup keeps an entry alive and the stalest one is evicted."""
+        cache = QueryCache(self.path, max_entries=3)
+        for query in ["a", "b", "c"]:
+            cache[query] = np.zeros(4)
+        cache.get("a")
+        cache["d"] = np.zeros(4)
+        self.assertEqual(list(cache), ["c", "a", "d"])
+        self.assertEqual(cache.evictions, 1)
+
+    def test_max_bytes_bounds_text_plus_vectors(self):
+        """Test that the byte budget counts query text and float32 embeddings."""
+        cache = QueryCache(self.path, max_bytes=100)
+        for i in range(5):
+            cache[f"q{i}"] = np.zeros(8)  # 2 bytes of text + 32 of float32
+        self.assertEqual(list(cache), ["q3", "q4"])
+        self.assertEqual(cache.stats()["bytes"], 68)
+
+    def test_ttl_expires_entries_and_their_log_records(self):
+        """Test that entries expire by age, also when the log is replayed."""
+        clock = mock.patch("query_cache.time.time", return_value=1000.0)
+        with clock as now:
+            cache = QueryCache(self.path, ttl=100)
+            cache["old"] = np.zeros(4)
+            now.return_value = 1050.0
+            cache["new"] = np.ones(4)
+            cache.flush()
+            now.return_value = 1120.0
+            self.assertIsNone(cache.get("old"))
+            self.assertEqual(cache.get("new").tolist(), [1, 1, 1, 1])
+            self.assertEqual(list(QueryCache(self.path, ttl=100)), ["new"])
+            now.return_value = 1160.0
+            self.assertEqual(list(QueryCache(self.path, ttl=100)), [])
+
+    def test_hit_and_miss_counters(self):
+        """Test that get() counts hits and misses and stats() reports the rate."""
+        cache = QueryCache()
+        cache.get("query")
+        cache["query"] = np.zeros(4)
+        cache.get("query")
+        cache.get("query")
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
+        self.assertAlmostEqual(stats["hit_rate"], 2 / 3)
+
+    def test_log_is_compacted_to_the_live_entries(self):
+        """Test that evicted records are dropped from the log once it doubles."""
+        cache = QueryCache(self.path, max_entries=2, flush_every=1)
+        for i in range(10):
+            cache[f"query {i}"] = np.full(4, i)
+        with open(self.path) as f:
+            self.assertLessEqual(len(f.readlines()), 4)
+        replayed = QueryCache(self.path, max_entries=2)
+        self.assertEqual(list(replayed), ["query 8", "query 9"])
+        self.assertEqual(replayed["query 9"].tolist(), [9, 9, 9, 9])
+
+    def test_dropped_cache_is_collected_and_flushed(self):
+        """Test that the at-exit hook does not keep a cache alive, and its writes survive."""
+        cache = QueryCache(self.path, flush_every=100)
+        cache["query"] = np.zeros(4)
+        ref = weakref.ref(cache)
+        del cache
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual(list(QueryCache(self.path)), ["query"])
+
+    def test_concurrent_inserts_and_flushes(self):
+        """Test that many threads caching queries lose nothing and never break the log."""
+        cache = QueryCache(self.path, max_entries=50, flush_every=4)
+
+        def work(thread):
+            for i in range(300):
+                query = f"query {thread} {i % 80}"
+                if cache.get(query) is None:
+                    cache[query] = np.full(8, thread, dtype=np.float32)
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(work, range(16)))  # re-raises any worker exception
+        cache.flush()
+        self.assertEqual(len(cache), 50)
+        replayed = QueryCache(self.path, max_entries=50)
+        self.assertEqual(sorted(replayed), sorted(cache))
+        for query in cache:
+            np.testing.assert_array_equal(replayed[query], cache[query])
+
+
+class TestBitmapIndex(unittest.TestCase):
+    """Test suite for the metadata filter index."""
+
+    def setUp(self):
+        self.metadata = [{"label": "common" if i % 2 else f"rare-{i}"} for i in range(100)]
+        self.filters = BitmapIndex(["label"])
+        self.filters.build(self.metadata)
+
+    def test_equality_and_any_of(self):
+        """Test single-value and list filters against a Python scan."""
+        mask = self.filters.mask({"label": "common"})
+        self.assertEqual(mask.tolist(), [m["label"] == "common" for m in self.metadata])
+        mask = self.filters.mask({"label": ["rare-0", "rare-4", "absent"]})
+        self.assertEqual(np.flatnonzero(mask).tolist(), [0, 4])
+
+    def test_common_values_use_bitmaps(self):
+        """Test that dense values are packed bitmaps and sparse values are row ids."""
+        entries = self.filters._entries["label"]
+        common = entries[self.filters._vocab["label"]["common"]]
+        rare = entries[self.filters._vocab["label"]["rare-0"]]
+        self.assertEqual(common.dtype, np.uint8)
+        self.assertEqual(rare.tolist(), [0])
+
+    def test_add_appended_rows(self):
+        """Test that appended rows are indexed without a rebuild."""
+        self.metadata += [{"label": "common"}, {"label": "new"}]
+        self.filters.add(self.metadata, 100)
+        self.assertEqual(self.filters.mask({"label": "common"}).sum(), 51)
+        self.assertEqual(np.flatnonzero(self.filters.mask({"label": "new"})).tolist(), [101])
+
+    def test_batched_adds_match_a_build(self):
+        """Test that many small appends index every value as one build would."""
+        metadata = [{"label": f"label-{i % 7}" if i % 3 else f"rare-{i}"} for i in range(500)]
+        filters = BitmapIndex(["label"])
+        for start in range(0, len(metadata), 64):
+            filters.add(metadata[: start + 64], start)
+        built = BitmapIndex(["label"])
+        built.build(metadata)
+        for value in ["label-1", "label-6", "rare-0", "rare-498", ["label-2", "rare-3"]]:
+            np.testing.assert_array_equal(
+                filters.mask({"label": value}), built.mask({"label": value})
+            )
+
+    def test_unindexed_field_raises(self):
+        """Test that filtering on a field without an index is an error."""
+        with self.assertRaises(ValueError):
+            self.filters.mask({"text": "anything"})
+
+
+class TestBM25(unittest.TestCase):
+    """Test suite for the lexical index and score fusion."""
+
+    def test_tokenize_splits_identifiers(self):
+        """Test that compound identifiers are indexed whole and by their parts."""
+        self.assertEqual(
+            tokenize("DiffExecutor run_target"),
+            ["diffexecutor", "diff", "executor", "run_target", "run", "target"],
+        )
+
+    def test_rare_terms_rank_first_and_incremental_add_matches_build(self):
+        """Test BM25 ranking and that appending documents equals rebuilding."""
+        texts = ["the executor runs", "the DiffExecutor wraps two executors", "the the the"]
+        index = BM25Index()
+        index.build(texts[:1])
+        index.add(texts, 1)
+        ids, _ = index.search(["DiffExecutor"], k=3)[0]
+        self.assertEqual(ids.tolist()[0], 1)
+        rebuilt = BM25Index()
+        rebuilt.build(texts)
+        np.testing.assert_allclose(index.scores("executor the"), rebuilt.scores("executor the"))
+
+    def test_rrf_rewards_agreement(self):
+        """Test that a row ranked well by both lists wins reciprocal rank fusion."""
+        first = (np.array([1, 2, 3]), np.array([0.9, 0.8, 0.7]))
+        second = (np.array([4, 2, 5]), np.array([9.0, 8.0, 7.0]))
+        ids, _ = fuse_rrf([first, second], k=2)
+        self.assertEqual(ids.tolist(), [2, 1])
+
+
+class TestDedup(unittest.TestCase):
+    """Test suite for MinHash/LSH near-duplicate detection."""
+
+    def test_near_duplicates_share_a_representative(self):
+        """Test that copies and small edits cluster while distinct texts do not."""
+        base = " ".join(f"word{i}" for i in range(200))
+        texts = [base, "something else entirely " * 20, base + " extra", base.upper()]
+        groups = near_duplicate_groups(MinHasher().signatures(texts), threshold=0.9)
+        self.assertEqual(groups.tolist(), [0, 1, 0, 0])
+
+
+class TestBinaryIndex(unittest.TestCase):
+    """Test suite for the sign-bit Hamming prefilter."""
+
+    def test_short_queries_against_long_chunks(self):
+        """Test recall when the queries are sparser than the corpus and off its mean."""
+        embedder = HashingEmbedder(dim=256)
+        docs = make_docs(400)
+        embeddings = vectordb._to_matrix(
+            embedder.embed([f"{doc['chunk_heading']}\n\n{doc['text']}" for doc in docs])
+        )
+        queries = vectordb._to_matrix(
+            embedder.embed([f"{TOPICS[i % len(TOPICS)]} part {i}?" for i in range(0, 400, 10)])
+        )
+        index = BinaryIndex(rescore_factor=4)
+        index.build(embeddings)
+        exact = np.argsort(-(queries @ embeddings.T), axis=1)[:, :5]
+        found = index.search(embeddings, queries, 5)
+        recall = np.mean([len(set(ids) & set(row)) / 5 for (ids, _), row in zip(found, exact)])
+        self.assertGreaterEqual(recall, 0.8)
+
+    def test_masked_rows_do_not_widen_the_rescore(self):
+        """Test that masked rows are skipped before the shortlist rather than over-fetched."""
+        rng = np.random.default_rng(0)
+        embeddings = rng.standard_normal((2000, 64)).astype(np.float32)
+        queries = embeddings[1::100] + 0.1 * rng.standard_normal((20, 64)).astype(np.float32)
+        mask = np.arange(2000) % 2 == 1  # every other row tombstoned
+
+        class RecordingMatrix:
+            def __init__(self, matrix):
+                self.matrix, self.rows_read = matrix, 0
+
+            def __getitem__(self, rows):
+                self.rows_read += len(rows)
+                return self.matrix[rows]
+
+        index = BinaryIndex(rescore_factor=4)
+        index.build(embeddings)
+        recorded = RecordingMatrix(embeddings)
+        found = index.search(recorded, queries, 10, mask=mask)
+        self.assertEqual(recorded.rows_read, 20 * 10 * 4)
+        for (ids, _), query in zip(found, queries):
+            self.assertEqual(len(ids), 10)
+            self.assertTrue(mask[ids].all())
+            self.assertEqual(ids[0], np.flatnonzero(mask)[np.argmax(embeddings[mask] @ query)])
+
+
+class TestVectorDB(unittest.TestCase):
+    """Test suite for VectorDB loading, search, upserts and persistence."""
+
+    def setUp(self):
+        """Run each test in a temporary directory with its own embedding cache."""
+        self.cwd = os.getcwd()
+        self.test_dir = tempfile.mkdtemp()
+        os.chdir(self.test_dir)
+        self.cache = EmbeddingCache(os.path.join(self.test_dir, "embeddings.sqlite3"))
+        self.docs = make_docs(60)
+        self.dbs = []
+
+    def tearDown(self):
+        """Flush pending query-cache writes before removing the temporary directory."""
+        for db in self.dbs:
+            db.query_cache.flush()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.test_dir)
+
+    def make_db(self, cls=VectorDB, **kwargs):
+        kwargs.setdefault("embedder", HashingEmbedder(dim=128))
+        db = cls("test", embedding_cache=self.cache, **kwargs)
+        self.dbs.append(db)
+        return db
+
+    # Search Tests
+
+    def test_search_finds_exact_chunk(self):
+        """Test that a chunk's own text is its best match."""
+        db = self.make_db()
+        db.load_data(self.docs)
+        results = db.search(db._format_text(self.docs[7]), k=3)
+        self.assertEqual(results[0]["metadata"]["chunk_link"], self.docs[7]["chunk_link"])
+        self.assertAlmostEqual(results[0]["similarity"], 1.0, places=5)
+
+    def test_search_batch_matches_search(self):
+        """Test that batched search returns the same rows as one-at-a-time search."""
+        db = self.make_db()
+        db.load_data(self.docs)
+        queries = ["billing", "tool use part 3", "streaming"]
+        batched = db.search_batch(queries, k=4, similarity_threshold=0.0)
+        for query, results in zip(queries, batched):
+            single = db.search(query, k=4, similarity_threshold=0.0)
+            self.assertEqual(
+                [r["metadata"]["chunk_link"] for r in results],
+                [r["metadata"]["chunk_link"] for r in single],
+            )
+
+    def test_search_without_data_raises(self):
+        """Test that searching an empty database is an error."""
+        with self.assertRaises(ValueError):
+            self.make_db().search("anything")
+
+    def test_where_restricts_results(self):
+        """Test that filtered search only returns, and ranks, the matching chunks."""
+        db = self.make_db()
+        db.load_data(self.docs)
+        headings = [self.docs[i]["chunk_heading"] for i in (2, 8, 14)]
+        results = db.search(
+            "billing", k=10, similarity_threshold=-1, where={"chunk_heading": headings}
+        )
+        self.assertEqual(sorted(r["metadata"]["chunk_heading"] for r in results), sorted(headings))
+        scores = [r["similarity"] for r in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_where_skips_deleted_chunks(self):
+        """Test that a filter never resurrects a deleted chunk."""
+        db = self.make_db(compact_threshold=1.0)
+        db.load_data(self.docs)
+        link = self.docs[4]["chunk_link"]
+        db.delete([link])
+        self.assertEqual(
+            db.search("billing", similarity_threshold=-1, where={"chunk_link": link}), []
+        )
+
+    def test_lexical_and_hybrid_modes(self):
+        """Test BM25-only and fused search over the same chunks."""
+        db = self.make_db(compact_threshold=1.0)
+        db.load_data(self.docs)
+        lexical = db.search("section 17", k=1, mode="lexical")
+        self.assertEqual(lexical[0]["metadata"]["chunk_link"], self.docs[17]["chunk_link"])
+        for fusion in ("rrf", "weighted"):
+            db.fusion = fusion
+            hybrid = db.search("section 17", k=3, similarity_threshold=-1, mode="hybrid")
+            self.assertEqual(hybrid[0]["metadata"]["chunk_link"], self.docs[17]["chunk_link"])
+        db.delete([self.docs[17]["chunk_link"]])
+        links = [r["metadata"]["chunk_link"] for r in db.search("section 17", k=5, mode="lexical")]
+        self.assertNotIn(self.docs[17]["chunk_link"], links)
+        with self.assertRaises(ValueError):
+            db.search("section 17", mode="sparse")
+
+    def test_indexes_agree_with_exact_search(self):
+        """Test that every index returns the exact top hit for a chunk's own text."""
+        for index in [
+            IVFIndex(nprobe=64),
+            HNSWIndex(),
+            ScalarQuantizedIndex(),
+            PQIndex(),
+            BinaryIndex(),
+            ProjectionIndex(dims=32),
+            ProjectionIndex(dims=32, method="prefix"),
+        ]:
+            with self.subTest(index=index.name, method=getattr(index, "method", None)):
+                db = self.make_db(index=index)
+                db.load_data(self.docs)
+                results = db.search(db._format_text(self.docs[11]), k=1)
+                self.assertEqual(results[0]["metadata"]["chunk_link"], self.docs[11]["chunk_link"])
+                shutil.rmtree("data")
+
+    def test_indexes_skip_tombstones(self):
+        """Test that every index returns k live chunks when many rows are tombstoned."""
+        deleted = {doc["chunk_link"] for doc in self.docs[::2]}
+        for index in [
+            IVFIndex(nprobe=64),
+            HNSWIndex(),
+            ScalarQuantizedIndex(),
+            PQIndex(),
+            BinaryIndex(),
+            ProjectionIndex(dims=32),
+        ]:
+            with self.subTest(index=index.name):
+                db = self.make_db(index=index, compact_threshold=1.0)
+                db.load_data(self.docs)
+                db.delete(deleted)
+                query = db._format_text(self.docs[11])
+                results = db.search(query, k=5, similarity_threshold=-1.0)
+                links = [result["metadata"]["chunk_link"] for result in results]
+                self.assertEqual(len(links), 5)
+                self.assertEqual(links[0], self.docs[11]["chunk_link"])
+                self.assertFalse(deleted & set(links))
+                shutil.rmtree("data")
+
+    def test_sharded_search_matches_exact_search(self):
+        """Test that merging per-shard top-k lists gives the exact scan's results."""
+        exact = self.make_db(compact_threshold=1.0)
+        sharded = self.make_db(compact_threshold=1.0, n_shards=3)
+        self.addCleanup(sharded.close)
+        queries = [exact._format_text(doc) for doc in self.docs[:8]]
+        for db in (exact, sharded):
+            db.load_data(self.docs)
+            db.delete([self.docs[5]["chunk_link"]])
+        self.assertEqual(
+            sharded.search_batch(queries, k=4, similarity_threshold=-1),
+            exact.search_batch(queries, k=4, similarity_threshold=-1),
+        )
+
+    # Persistence Tests
+
+    def test_reload_from_disk_embeds_nothing(self):
+        """Test that a saved database is reloaded without embedding again."""
+        self.make_db().load_data(self.docs)
+        embedder = CountingEmbedder(dim=128)
+        db = self.make_db(embedder=embedder)
+        db.load_data(self.docs)
+        self.assertEqual(embedder.embedded, 0)
+        self.assertEqual(len(db.embeddings), len(self.docs))
+
+    def test_reload_with_other_embedder_raises(self):
+        """Test that a database cannot be searched with a different vector space."""
+        self.make_db().load_data(self.docs)
+        with self.assertRaises(ValueError):
+            self.make_db(embedder=HashingEmbedder(dim=64)).load_db()
+
+    # Upsert and Delete Tests
+
+    def test_load_data_embeds_only_changes(self):
+        """Test that syncing to edited data embeds only new and changed chunks."""
+        self.make_db().load_data(self.docs)
+        edited = [dict(doc) for doc in self.docs[:-1]]
+        edited[5]["text"] = "A rewritten chunk about prompt caching."
+        edited.append({**self.docs[0], "chunk_link": "https://docs.example.com/new"})
+
+        embedder = CountingEmbedder(dim=128)
+        db = self.make_db(embedder=embedder, compact_threshold=1.0)
+        db.load_data(edited)
+        self.assertEqual(embedder.embedded, 2)
+        self.assertEqual(len(db.deleted), 2)
+
+        results = db.search(db._format_text(edited[5]), k=1)
+        self.assertEqual(results[0]["metadata"]["text"], edited[5]["text"])
+        links = {
+            r["metadata"]["chunk_link"] for r in db.search("part", k=100, similarity_threshold=0)
+        }
+        self.assertNotIn(self.docs[-1]["chunk_link"], links)
+
+    def test_delete_and_compact(self):
+        """Test that deleted chunks disappear from search and from disk after compaction."""
+        db = self.make_db(compact_threshold=1.0)
+        db.load_data(self.docs)
+        deleted_link = self.docs[3]["chunk_link"]
+        self.assertEqual(db.delete([deleted_link, "missing"]), 1)
+        results = db.search(db._format_text(self.docs[3]), k=len(self.docs), similarity_threshold=0)
+        self.assertNotIn(deleted_link, [r["metadata"]["chunk_link"] for r in results])
+
+        db.compact()
+        self.assertEqual(len(db.embeddings), len(self.docs) - 1)
+        reloaded = self.make_db()
+        reloaded.load_db()
+        self.assertEqual(len(reloaded.metadata), len(self.docs) - 1)
+        self.assertFalse(reloaded.deleted)
+
+    def test_interrupted_compaction_reloads_consistently(self):
+        """Test that a compaction stopped before or after its sidecar write loads correctly."""
+        real_replace = os.replace
+
+        def fail_matrix_swap(src, dst):
+            if dst.endswith(".npy") and not src.endswith(".tmp"):
+                raise RuntimeError("interrupted")
+            real_replace(src, dst)
+
+        interruptions = [
+            (
+                "_save_metadata",
+                mock.patch.object(VectorDB, "_save_metadata", side_effect=RuntimeError),
+            ),
+            (
+                "matrix swap",
+                mock.patch.object(vectordb.os, "replace", side_effect=fail_matrix_swap),
+            ),
+        ]
+        for name, interruption in interruptions:
+            with self.subTest(name):
+                shutil.rmtree("data", ignore_errors=True)
+                db = self.make_db(compact_threshold=1.0)
+                db.load_data(self.docs)
+                db.delete([doc["chunk_link"] for doc in self.docs[:10]])
+                with interruption, self.assertRaises(RuntimeError):
+                    db.compact()
+                reloaded = self.make_db()
+                reloaded.load_db()
+                self.assertEqual(len(reloaded.embeddings), len(reloaded.metadata))
+                doc = self.docs[20]
+                result = reloaded.search(reloaded._format_text(doc), k=1)[0]
+                self.assertEqual(result["metadata"]["chunk_link"], doc["chunk_link"])
+                self.assertAlmostEqual(result["similarity"], 1.0, places=5)
+                self.assertFalse(os.path.exists(f"{db.embeddings_path}.1"))
+
+    def test_load_db_rejects_a_matrix_shorter_than_its_sidecar(self):
+        """Test that a matrix missing rows the sidecar describes is not loaded shifted."""
+        db = self.make_db()
+        db.load_data(self.docs)
+        vectordb._save_matrix(db.embeddings_path, db.embeddings[10:])
+        with self.assertRaises(ValueError):
+            self.make_db().load_db()
+
+    def test_load_data_collapses_near_duplicates(self):
+        """Test that duplicate chunks are stored once, with links to the copies."""
+        copies = [
+            dict(self.docs[3], chunk_link=f"https://mirror.example.com/{i}") for i in range(2)
+        ]
+        db = self.make_db(dedup_threshold=0.9)
+        db.load_data(self.docs + copies)
+        self.assertEqual(len(db._rows), len(self.docs))
+        row = db._rows[self.docs[3]["chunk_link"]]
+        self.assertEqual(db.metadata[row]["duplicates"], [c["chunk_link"] for c in copies])
+        # Dropping a copy updates the representative's links without re-embedding it.
+        db.load_data(self.docs + copies[:1])
+        row = db._rows[self.docs[3]["chunk_link"]]
+        self.assertEqual(db.metadata[row]["duplicates"], [copies[0]["chunk_link"]])
+        self.assertEqual(len(db.embeddings), len(self.docs))
+
+    def test_ingest_streams_json_jsonl_and_generators(self):
+        """Test that every ingest source yields the same store as load_data."""
+        expected = self.make_db()
+        expected.load_data(self.docs)
+        with open("docs.json", "w") as f:
+            json.dump(self.docs, f, indent=2)
+        with open("docs.jsonl", "w") as f:
+            f.writelines(json.dumps(doc) + "\n" for doc in self.docs)
+        self.assertEqual(list(vectordb.iter_chunks("docs.json")), self.docs)
+        self.assertEqual(list(vectordb.iter_chunks("docs.jsonl")), self.docs)
+
+        for source in ("docs.json", "docs.jsonl", (doc for doc in self.docs)):
+            shutil.rmtree("data")
+            db = self.make_db()
+            counts = db.ingest(source, batch_size=7, checkpoint_every=3)
+            self.assertEqual(counts["inserted"], len(self.docs))
+            np.testing.assert_array_equal(db.embeddings, expected.embeddings)
+            self.assertEqual(db.metadata, self.docs)
+
+        # Re-ingesting a subset embeds nothing and can drop the missing chunks.
+        embedder = CountingEmbedder(dim=128)
+        db = self.make_db(embedder=embedder, compact_threshold=1.0)
+        counts = db.ingest(self.docs[:50], batch_size=7, delete_missing=True)
+        self.assertEqual(embedder.embedded, 0)
+        self.assertEqual((counts["unchanged"], counts["deleted"]), (50, 10))
+
+    def test_load_db_drops_rows_past_the_last_checkpoint(self):
+        """Test that rows appended after the sidecar was last saved are discarded."""
+        db = self.make_db()
+        db.ingest(self.docs[:30])
+        vectordb._append_rows(db.embeddings_path, db.embeddings[:5])
+        reloaded = self.make_db()
+        reloaded.load_db()
+        self.assertEqual(len(reloaded.embeddings), 30)
+        self.assertEqual(np.load(db.embeddings_path).shape, (30, 128))
+
+    def test_interrupted_ingest_keeps_its_journaled_checkpoints(self):
+        """Test that checkpoints append to the journal instead of rewriting the sidecar."""
+        db = self.make_db()
+        db.load_data(self.docs[:20])
+        edited = dict(self.docs[5], text="Rewritten. " + self.docs[5]["text"])
+        source = [edited] + self.docs[20:50]
+
+        def interrupted():
+            yield from source
+            raise RuntimeError("interrupted")
+
+        with (
+            mock.patch.object(db, "_save_metadata", wraps=db._save_metadata) as save,
+            self.assertRaises(RuntimeError),
+        ):
+            db.ingest(interrupted(), batch_size=5, checkpoint_every=2)
+        self.assertEqual(save.call_count, 0)
+        with open(db.journal_path, "a") as f:
+            f.write('{"row": 45, "meta')  # a checkpoint cut off mid-line
+
+        # Batches 1-5 were checkpointed: 25 chunks, one of which replaced docs[5].
+        reloaded = self.make_db()
+        reloaded.load_db()
+        self.assertEqual(len(reloaded.metadata), 45)
+        self.assertEqual(reloaded.deleted, {5})
+        self.assertEqual(reloaded.metadata[reloaded._rows[edited["chunk_link"]]], edited)
+        self.assertIn(self.docs[43]["chunk_link"], reloaded._rows)
+        self.assertNotIn(self.docs[44]["chunk_link"], reloaded._rows)
+
+        counts = reloaded.ingest(source, batch_size=5)
+        self.assertEqual((counts["unchanged"], counts["inserted"]), (25, 6))
+        self.assertFalse(os.path.exists(reloaded.journal_path))
+        with open(reloaded.metadata_path) as f:
+            self.assertEqual(len(json.load(f)["metadata"]), 51)
+
+    def test_summary_indexed_db_embeds_summaries(self):
+        """Test that SummaryIndexedVectorDB includes the summary in the embedded text."""
+        db = self.make_db(SummaryIndexedVectorDB)
+        db.load_data(self.docs)
+        query = db._format_text(self.docs[9])
+        self.assertEqual(
+            db.search(query, k=1)[0]["metadata"]["chunk_link"], self.docs[9]["chunk_link"]
+        )
+
+    def test_load_shared_reuses_one_store_per_source(self):
+        """Test that stores built from the same class, source and model are shared."""
+        with open("docs.json", "w") as f:
+            json.dump(self.docs, f)
+        cache_path = os.path.join(self.test_dir, "embeddings.sqlite3")
+        with (
+            mock.patch.dict(os.environ, {"EMBEDDING_CACHE_PATH": cache_path}),
+            mock.patch.dict(vectordb._shared_dbs, clear=True),
+        ):
+            first = load_shared(SummaryIndexedVectorDB, "a", "docs.json", HashingEmbedder())
+            second = load_shared(SummaryIndexedVectorDB, "b", "docs.json", HashingEmbedder())
+            other_model = load_shared(SummaryIndexedVectorDB, "c", "docs.json", HashingEmbedder(64))
+            other_class = load_shared(VectorDB, "d", "docs.json", HashingEmbedder())
+            self.dbs += [first, other_model, other_class]
+        self.assertIs(first, second)
+        self.assertIsNot(first, other_model)
+        self.assertIsNot(first, other_class)
+        self.assertFalse(os.path.exists("data/b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,173 +1,851 @@
+import copy
+import hashlib
+import io
+import itertools
+import json
 import os
 import pickle
-import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-import voyageai
+from bitmap_index import BitmapIndex
+from bm25 import BM25Index, fuse_rrf, fuse_weighted
+from dedup import collapse_near_duplicates
+from embedders import VoyageEmbedder
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline
+from query_cache import QueryCache
+from sharding import ShardedScanner
 
 
-class VectorDB:
-    def __init__(self, name, api_key=None):
-        if api_key is None:
-            api_key = os.getenv("VOYAGE_API_KEY")
-        self.client = voyageai.Client(api_key=api_key)
-        self.name = name
-        self.embeddings = []
-        self.metadata = []
-        self.query_cache = {}
-        self.db_path = f"./data/{name}/vector_db.pkl"
+def _to_matrix(embeddings):
+    """Stack embeddings into one contiguous float32 matrix with unit-length rows."""
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+    if matrix.size == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
 
-    def load_data(self, data):
-        if self.embeddings and self.metadata:
-            print("Vector database is already loaded. Skipping data loading.")
+
+def _top_k(similarities, k, similarity_threshold):
+    """Indices of the k highest similarities at or above the threshold, best first."""
+    candidates = np.flatnonzero(similarities >= similarity_threshold)
+    if k <= 0:
+        return candidates[:0]
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(similarities[candidates], -k)[-k:]]
+    return candidates[np.argsort(-similarities[candidates], kind="stable")]
+
+
+def _save_matrix(path, matrix):
+    """Write a float32 matrix as a raw .npy file, atomically replacing any existing copy."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.save(file, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def _read_header(file):
+    """(version, shape, fortran_order, dtype, header size) of an open .npy file."""
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+    return version, shape, fortran_order, dtype, file.tell()
+
+
+def _header_bytes(version, dtype, fortran_order, shape):
+    header = io.BytesIO()
+    header_data = {
+        "descr": np.lib.format.dtype_to_descr(dtype),
+        "fortran_order": fortran_order,
+        "shape": shape,
+    }
+    if version == (1, 0):
+        np.lib.format.write_array_header_1_0(header, header_data)
+    else:
+        np.lib.format.write_array_header_2_0(header, header_data)
+    return header.getvalue()
+
+
+def _append_rows(path, rows):
+    """Append rows to a 2-D float32 .npy file in place, rewriting only its fixed-size header.
+
+    Falls back to rewriting the whole file when it is missing, holds a different row
+    width, or the grown shape no longer fits in the header's padding.
+    """
+    rows = np.ascontiguousarray(rows, dtype=np.float32)
+    if not os.path.exists(path):
+        _save_matrix(path, rows)
+        return
+    with open(path, "r+b") as file:
+        version, shape, fortran_order, dtype, header_size = _read_header(file)
+        header = _header_bytes(version, dtype, fortran_order, (shape[0] + len(rows), rows.shape[1]))
+        if (
+            dtype == np.float32
+            and not fortran_order
+            and shape[1:] == rows.shape[1:]
+            and len(header) == header_size
+        ):
+            # Data first, then the header, so an interrupted append leaves the old shape.
+            file.seek(header_size + shape[0] * rows.shape[1] * rows.itemsize)
+            file.write(rows.tobytes())
+            file.flush()
+            file.seek(0)
+            file.write(header)
             return
-        if os.path.exists(self.db_path):
-            print("Loading vector database from disk.")
-            self.load_db()
+    existing = np.load(path, mmap_mode="r")
+    _save_matrix(path, np.concatenate([existing, rows]) if existing.size else rows)
+
+
+def _truncate_rows(path, n_rows):
+    """Drop the rows after the first `n_rows` of a 2-D float32 .npy file in place."""
+    with open(path, "r+b") as file:
+        version, shape, fortran_order, dtype, header_size = _read_header(file)
+        header = _header_bytes(version, dtype, fortran_order, (n_rows, *shape[1:]))
+        if len(header) == header_size:
+            file.seek(0)
+            file.write(header)
+            file.truncate(header_size + n_rows * int(np.prod(shape[1:])) * dtype.itemsize)
             return
+    _save_matrix(path, np.load(path, mmap_mode="r")[:n_rows])
 
-        texts = [f"Heading: {item['chunk_heading']}\n\n Chunk Text:{item['text']}" for item in data]
-        self._embed_and_store(texts, data)
-        self.save_db()
-        print("Vector database loaded and saved.")
 
-    def _embed_and_store(self, texts, data):
-        batch_size = 128
-        result = [
-            self.client.embed(texts[i : i + batch_size], model="voyage-2").embeddings
-            for i in range(0, len(texts), batch_size)
-        ]
-        self.embeddings = [embedding for batch in result for embedding in batch]
-        self.metadata = data
+def _load_matrix(path):
+    """Open a .npy matrix read-only through np.memmap so processes share the page cache."""
+    matrix = np.load(path, mmap_mode="r")
+    if matrix.dtype != np.float32 or matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D float32 matrix in {path}, got {matrix.dtype}.")
+    return matrix
 
-    def search(self, query, k=3, similarity_threshold=0.75):
-        if query in self.query_cache:
-            query_embedding = self.query_cache[query]
-        else:
-            query_embedding = self.client.embed([query], model="voyage-2").embeddings[0]
-            self.query_cache[query] = query_embedding
 
-        if not self.embeddings:
-            raise ValueError("No data loaded in the vector database.")
+def _iter_json_array(file, chunk_size=1 << 16):
+    """Decode the items of a top-level JSON array one at a time, reading as needed."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError(f"Expected a JSON array in {file.name}.")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().removeprefix(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            more = file.read(chunk_size)
+            if not more:
+                raise
+            buffer += more
+            continue
+        yield item
+        buffer = buffer[end:]
 
-        similarities = np.dot(self.embeddings, query_embedding)
-        top_indices = np.argsort(similarities)[::-1]
-        top_examples = []
 
-        for idx in top_indices:
-            if similarities[idx] >= similarity_threshold:
-                example = {
-                    "metadata": self.metadata[idx],
-                    "similarity": similarities[idx],
-                }
-                top_examples.append(example)
+def iter_chunks(source):
+    """Yield chunks one at a time from a .jsonl file, a .json array file or an iterable."""
+    if not isinstance(source, (str, os.PathLike)):
+        yield from source
+        return
+    with open(source, "r") as file:
+        if os.fspath(source).endswith(".jsonl"):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(file)
 
-                if len(top_examples) >= k:
-                    break
-        self.save_db()
-        return top_examples
 
-    def save_db(self):
-        data = {
-            "embeddings": self.embeddings,
-            "metadata": self.metadata,
-            "query_cache": json.dumps(self.query_cache),
-        }
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        with open(self.db_path, "wb") as file:
-            pickle.dump(data, file)
+def _batched(items, size):
+    iterator = iter(items)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
 
-    def load_db(self):
-        if not os.path.exists(self.db_path):
-            raise ValueError(
-                "Vector database file not found. Use load_data to create a new database."
-            )
-        with open(self.db_path, "rb") as file:
-            data = pickle.load(file)
-        self.embeddings = data["embeddings"]
-        self.metadata = data["metadata"]
-        self.query_cache = json.loads(data["query_cache"])
 
+class VectorDB:
+    db_filename = "vector_db.pkl"
+    id_field = "chunk_link"  # metadata key that identifies a chunk across upserts
+    filter_fields = ("chunk_link", "chunk_heading")  # fields search(where=...) can filter on
 
-class SummaryIndexedVectorDB:
-    def __init__(self, name, api_key=None):
-        if api_key is None:
-            api_key = os.getenv("VOYAGE_API_KEY")
-        self.client = voyageai.Client(api_key=api_key)
+    def __init__(
+        self,
+        name,
+        api_key=None,
+        query_cache_size=10_000,
+        query_cache_bytes=None,
+        query_cache_ttl=None,
+        index=None,
+        compact_threshold=0.2,
+        embedding_cache=None,
+        embedding_pipeline=None,
+        embedder=None,
+        fusion="rrf",
+        hybrid_alpha=0.5,
+        n_shards=None,
+        dedup_threshold=None,
+    ):
+        # Any embedder from embedders.py; Voyage (keyed by api_key) unless one is given.
+        self.embedder = VoyageEmbedder(api_key=api_key) if embedder is None else embedder
+        # Shared with every other store, so a text is only ever embedded once per model.
+        self.embedding_cache = EmbeddingCache() if embedding_cache is None else embedding_cache
+        # Concurrency, rate limits and retries for the API calls the cache cannot answer.
+        self.embedding_pipeline = embedding_pipeline or EmbeddingPipeline()
         self.name = name
-        self.embeddings = []
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
         self.metadata = []
-        self.query_cache = {}
-        self.db_path = f"./data/{name}/summary_indexed_vector_db.pkl"
+        self.hashes = []  # sha256 of each row's embedded text, parallel to metadata
+        self.deleted = set()  # tombstoned rows, dropped from disk by compact()
+        self._rows = {}  # chunk id -> live row
+        self.filters = BitmapIndex(self.filter_fields)
+        self.db_path = f"./data/{name}/{self.db_filename}"
+        # Bounded by entry count, bytes and/or age so long-running services don't grow forever.
+        self.query_cache = QueryCache(
+            self.query_cache_path,
+            max_entries=query_cache_size,
+            max_bytes=query_cache_bytes,
+            ttl=query_cache_ttl,
+        )
+        # Optional approximate index (see indexes.py); None means an exact scan.
+        self.index = index
+        # Deleted rows are compacted away in the background once they exceed this fraction.
+        self.compact_threshold = compact_threshold
+        self._lock = threading.RLock()
+        self._version = 0
+        self._generation = 0  # bumped by each compaction; recorded in the sidecar
+        self._compactor = None
+        # Rows covered by the sidecar plus its journal, and rows refreshed in place since.
+        self._saved_rows = 0
+        self._refreshed = set()
+        # BM25 over the same chunks for mode="lexical" / "hybrid", built on first use.
+        self.lexical = BM25Index()
+        self.fusion = fusion  # "rrf" or "weighted" (hybrid_alpha * dense + rest * lexical)
+        self.hybrid_alpha = hybrid_alpha
+        # Exact scans split across this many worker processes sharing the memmapped matrix.
+        self.sharded = ShardedScanner(n_shards) if n_shards else None
+        # load_data keeps one chunk per near-duplicate cluster (MinHash Jaccard >= this).
+        self.dedup_threshold = dedup_threshold
+
+    @property
+    def embeddings_path(self):
+        return os.path.splitext(self.db_path)[0] + ".npy"
+
+    @property
+    def metadata_path(self):
+        return os.path.splitext(self.db_path)[0] + ".json"
+
+    @property
+    def journal_path(self):
+        return os.path.splitext(self.db_path)[0] + ".journal.jsonl"
+
+    @property
+    def query_cache_path(self):
+        return os.path.splitext(self.db_path)[0] + "_query_cache.jsonl"
+
+    @property
+    def index_path(self):
+        return os.path.splitext(self.db_path)[0] + f".{self.index.name}.npz"
+
+    @property
+    def lexical_path(self):
+        return os.path.splitext(self.db_path)[0] + f".{self.lexical.name}.npz"
+
+    def _format_text(self, item):
+        return f"Heading: {item['chunk_heading']}\n\n Chunk Text:{item['text']}"
+
+    def _hash(self, item):
+        return hashlib.sha256(self._format_text(item).encode()).hexdigest()
 
     def load_data(self, data):
-        if self.embeddings and self.metadata:
-            print("Vector database is already loaded. Skipping data loading.")
-            return
-        if os.path.exists(self.db_path):
+        """Load the database from disk, or embed `data` into a new one, and sync it to `data`.
+
+        Only chunks that are new or whose text changed since the last load are embedded;
+        chunks missing from `data` are deleted. With `dedup_threshold` set, near-duplicate
+        chunks are collapsed first into the earliest copy, whose metadata lists the
+        others' ids under "duplicates".
+        """
+        if not self.metadata and (
+            os.path.exists(self.embeddings_path) or os.path.exists(self.db_path)
+        ):
             print("Loading vector database from disk.")
             self.load_db()
+
+        if self.dedup_threshold is not None:
+            texts = [self._format_text(item) for item in data]
+            kept = collapse_near_duplicates(data, texts, self.id_field, self.dedup_threshold)
+            if len(kept) < len(data):
+                print(f"Collapsed {len(data) - len(kept)} near-duplicate chunks.")
+            data = kept
+
+        ids = {item[self.id_field] for item in data}
+        changes = self.upsert(data)
+        changes["deleted"] = self.delete(
+            [chunk_id for chunk_id in self._rows if chunk_id not in ids]
+        )
+        if changes["inserted"] or changes["updated"] or changes["deleted"]:
+            print(
+                f"Vector database synced: {changes['inserted']} inserted, "
+                f"{changes['updated']} updated, {changes['deleted']} deleted."
+            )
+
+    def _embed_texts(self, texts):
+        return _to_matrix(
+            self.embedding_cache.embed(self.embedder, texts, pipeline=self.embedding_pipeline)
+        )
+
+    def upsert(self, items):
+        """Insert new chunks and re-embed changed ones, keyed by `id_field`.
+
+        A chunk whose text hash is unchanged is skipped without calling the embedding
+        API (its metadata is still replaced if other fields changed). A changed chunk's
+        old row is tombstoned and its new row appended, so the matrix on disk only ever
+        grows at the end until it is compacted. Returns the number of inserted, updated
+        and unchanged chunks.
+        """
+        changed, counts = self._plan(items)
+        if not changed:
+            return counts
+        embeddings = self._embed_texts([self._format_text(item) for item, _ in changed])
+        self._commit(changed, embeddings, counts)
+        self._maybe_compact()
+        return counts
+
+    def _plan(self, items, persist=True):
+        """Split `items` into (item, hash) pairs that need embedding and refresh the rest.
+
+        Chunks whose text is unchanged but whose other metadata differs are updated in
+        place; with persist=False they are left for the next _checkpoint. Returns the
+        changed pairs and the counts so far.
+        """
+        items = list({item[self.id_field]: item for item in items}.values())
+        hashes = [self._hash(item) for item in items]
+        with self._lock:
+            changed = [
+                (item, digest)
+                for item, digest in zip(items, hashes)
+                if item[self.id_field] not in self._rows
+                or self.hashes[self._rows[item[self.id_field]]] != digest
+            ]
+            same_text = [
+                (self._rows[item[self.id_field]], item)
+                for item, digest in zip(items, hashes)
+                if item[self.id_field] in self._rows
+                and self.hashes[self._rows[item[self.id_field]]] == digest
+            ]
+            refreshed = [(row, item) for row, item in same_text if self.metadata[row] != item]
+            if refreshed:
+                for row, item in refreshed:
+                    self.metadata[row] = item
+                    self._refreshed.add(row)
+                self.filters.build(self.metadata)
+                self._version += 1
+                if persist:
+                    self._save_metadata()
+        counts = {
+            "inserted": 0,
+            "updated": len(refreshed),
+            "unchanged": len(items) - len(changed) - len(refreshed),
+        }
+        return changed, counts
+
+    def _commit(self, changed, embeddings, counts, persist=True):
+        """Append the embedded rows for `changed`, tombstoning any rows they replace.
+
+        With persist=False the sidecar and index are left for a later _checkpoint; rows
+        appended past the saved metadata and journal are dropped by load_db.
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            _append_rows(self.embeddings_path, embeddings)
+            self.embeddings = _load_matrix(self.embeddings_path)
+            for item, digest in changed:
+                old_row = self._rows.get(item[self.id_field])
+                if old_row is None:
+                    counts["inserted"] += 1
+                else:
+                    self.deleted.add(old_row)
+                    counts["updated"] += 1
+                self._rows[item[self.id_field]] = len(self.metadata)
+                self.metadata.append(item)
+                self.hashes.append(digest)
+            self.filters.add(self.metadata, len(self.filters))
+            self._version += 1
+            if persist:
+                self._save_metadata()
+                self._sync_index()
+
+    def ingest(self, source, batch_size=512, delete_missing=False, checkpoint_every=20):
+        """Upsert chunks streamed from `source` without holding the corpus in memory.
+
+        `source` is a .jsonl or .json file path (read lazily, see iter_chunks) or any
+        iterable of chunks, such as a generator. Chunks are embedded `batch_size` at a
+        time, and the next batch is embedded while the previous one is appended to the
+        matrix on disk. Every `checkpoint_every` batches the new rows' metadata is
+        appended to the journal (see _checkpoint); the sidecar and index are saved once
+        at the end. With delete_missing, chunks not in
+        `source` are deleted, as in load_data. Near-duplicates are not collapsed here.
+        Returns the number of inserted, updated, unchanged and deleted chunks.
+        """
+        if not self.metadata and os.path.exists(self.embeddings_path):
+            self.load_db()
+        totals = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+        seen = set()
+
+        def commit(pending, checkpoint):
+            changed, counts, future = pending
+            if changed:
+                self._commit(changed, future.result(), counts, persist=False)
+            for key, value in counts.items():
+                totals[key] += value
+            if checkpoint:
+                with self._lock:
+                    self._checkpoint()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = None
+            for batch_number, batch in enumerate(_batched(iter_chunks(source), batch_size), 1):
+                seen.update(item[self.id_field] for item in batch)
+                changed, counts = self._plan(batch, persist=False)
+                # A chunk repeated in a later batch is planned before the earlier copy is
+                # committed, so it is appended again and the earlier row tombstoned.
+                texts = [self._format_text(item) for item, _ in changed]
+                future = executor.submit(self._embed_texts, texts) if changed else None
+                if pending is not None:
+                    commit(pending, checkpoint=batch_number % checkpoint_every == 0)
+                pending = (changed, counts, future)
+            if pending is not None:
+                commit(pending, checkpoint=False)
+        with self._lock:
+            self._save_metadata()
+            self._sync_index()
+        if delete_missing:
+            totals["deleted"] = self.delete(
+                [chunk_id for chunk_id in self._rows if chunk_id not in seen]
+            )
+        self._maybe_compact()
+        return totals
+
+    def delete(self, ids):
+        """Tombstone the chunks with these ids; returns how many were live."""
+        with self._lock:
+            rows = [self._rows.pop(chunk_id) for chunk_id in set(ids) if chunk_id in self._rows]
+            if rows:
+                self.deleted.update(rows)
+                self._version += 1
+                self._save_metadata()
+        self._maybe_compact()
+        return len(rows)
+
+    def _maybe_compact(self):
+        if len(self.deleted) <= self.compact_threshold * len(self.metadata):
+            return
+        if self._compactor is not None and self._compactor.is_alive():
             return
+        # Not a daemon, so interpreter exit waits for the compaction to finish.
+        self._compactor = threading.Thread(target=self.compact)
+        self._compactor.start()
 
-        texts = [
-            f"{item['chunk_heading']}\n\n{item['text']}\n\n{item['summary']}" for item in data
-        ]  # Embed Chunk Heading + Text + Summary Together
-        self._embed_and_store(texts, data)
-        self.save_db()
-        print("Vector database loaded and saved.")
+    def compact(self):
+        """Rewrite the matrix, sidecar and index without the tombstoned rows.
 
-    def _embed_and_store(self, texts, data):
-        batch_size = 128
-        result = [
-            self.client.embed(texts[i : i + batch_size], model="voyage-2").embeddings
-            for i in range(0, len(texts), batch_size)
-        ]
-        self.embeddings = [embedding for batch in result for embedding in batch]
-        self.metadata = data
+        The surviving rows are copied and the index rebuilt without holding the lock,
+        so searches keep running; the result is swapped in only if no upsert or delete
+        happened meanwhile (otherwise the next one triggers a fresh compaction).
+        """
+        with self._lock:
+            if not self.deleted:
+                return
+            version = self._version
+            embeddings, metadata, hashes = self.embeddings, self.metadata, self.hashes
+            keep = np.setdiff1d(np.arange(len(metadata)), np.fromiter(self.deleted, np.int64))
+            index = copy.deepcopy(self.index)
 
-    def search(self, query, k=5, similarity_threshold=0.75):
-        if query in self.query_cache:
-            query_embedding = self.query_cache[query]
-        else:
-            query_embedding = self.client.embed([query], model="voyage-2").embeddings[0]
-            self.query_cache[query] = query_embedding
+        embeddings = np.ascontiguousarray(embeddings[keep])
+        if index is not None:
+            index.build(embeddings)
+
+        with self._lock:
+            if self._version != version:
+                return
+            self.embeddings = embeddings
+            self.metadata = [metadata[row] for row in keep]
+            self.hashes = [hashes[row] for row in keep]
+            self.deleted = set()
+            self._reindex_rows()
+            # The matrix is written under the next generation's name and the sidecar
+            # recording that generation is saved before the matrix is swapped in, so
+            # load_db can tell an interrupted swap from a finished one.
+            generation = self._generation + 1
+            pending_path = f"{self.embeddings_path}.{generation}"
+            _save_matrix(pending_path, embeddings)
+            self._generation = generation
+            self._save_metadata()
+            os.replace(pending_path, self.embeddings_path)
+            self.embeddings = _load_matrix(self.embeddings_path)
+            if index is not None:
+                self.index = index
+                self.index.save(self.index_path)
+            # Row ids shifted, so the BM25 index is rebuilt on the next lexical search.
+            self.lexical.build([])
+            if os.path.exists(self.lexical_path):
+                os.remove(self.lexical_path)
+            self._version += 1
+
+    def _reindex_rows(self):
+        self._rows = {
+            item[self.id_field]: row
+            for row, item in enumerate(self.metadata)
+            if row not in self.deleted
+        }
+        self.filters.build(self.metadata)
+
+    def _embed_queries(self, queries):
+        embeddings = {}
+        for query in dict.fromkeys(queries):
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                embeddings[query] = cached
+        missing = [query for query in dict.fromkeys(queries) if query not in embeddings]
+        for query, embedding in zip(
+            missing,
+            self.embedding_cache.embed(self.embedder, missing, pipeline=self.embedding_pipeline),
+        ):
+            self.query_cache[query] = embedding
+            embeddings[query] = embedding
+        return _to_matrix([embeddings[query] for query in queries])
+
+    def search(self, query, k=3, similarity_threshold=0.75, where=None, mode="dense"):
+        return self.search_batch(
+            [query], k=k, similarity_threshold=similarity_threshold, where=where, mode=mode
+        )[0]
+
+    def search_batch(self, queries, k=3, similarity_threshold=0.75, where=None, mode="dense"):
+        """Search for many queries at once and return one result list per query.
+
+        Uncached queries are embedded together and scored with a single matrix-matrix
+        product per block of queries rather than one matrix-vector product each.
+        `where` (e.g. {"chunk_heading": [...]}) restricts the search to rows whose
+        `filter_fields` match; see BitmapIndex.mask for the syntax.
 
-        if not self.embeddings:
+        `mode="lexical"` ranks by BM25 instead (no embedding call; "similarity" is the
+        BM25 score), and `mode="hybrid"` fuses the dense hits above the threshold with
+        the BM25 hits using `self.fusion` ("similarity" is then the fused score).
+        """
+        if mode not in ("dense", "lexical", "hybrid"):
+            raise ValueError(f"Unknown search mode {mode!r}.")
+        if not len(self.embeddings):
             raise ValueError("No data loaded in the vector database.")
 
-        similarities = np.dot(self.embeddings, query_embedding)
-        top_indices = np.argsort(similarities)[::-1]
-        top_examples = []
+        query_embeddings = self._embed_queries(queries) if mode != "lexical" else None
+        # Held so a background compaction cannot swap rows out from under the scan.
+        with self._lock:
+            if mode == "dense":
+                hits = self._hits(query_embeddings, k, similarity_threshold, where)
+            elif mode == "lexical":
+                hits = self._lexical_hits(queries, k, where)
+            else:
+                hits = self._hybrid_hits(queries, query_embeddings, k, similarity_threshold, where)
+            return [
+                [
+                    {"metadata": self.metadata[idx], "similarity": float(score)}
+                    for idx, score in zip(ids, scores)
+                ]
+                for ids, scores in hits
+            ]
 
-        for idx in top_indices:
-            if similarities[idx] >= similarity_threshold:
-                example = {
-                    "metadata": self.metadata[idx],
-                    "similarity": similarities[idx],
-                }
-                top_examples.append(example)
+    def _lexical_hits(self, queries, k, where=None):
+        self._sync_lexical()
+        mask = self.filters.mask(where) if where else np.ones(len(self.metadata), dtype=bool)
+        mask[np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))] = False
+        return self.lexical.search(queries, k, mask=mask)
 
-                if len(top_examples) >= k:
-                    break
-        self.save_db()
-        return top_examples
+    def _hybrid_hits(self, queries, query_embeddings, k, similarity_threshold, where=None):
+        depth = max(10 * k, 50)  # candidates taken from each ranking before fusion
+        dense = self._hits(query_embeddings, depth, similarity_threshold, where)
+        lexical = self._lexical_hits(queries, depth, where)
+        for dense_hits, lexical_hits in zip(dense, lexical):
+            if self.fusion == "weighted":
+                weights = (self.hybrid_alpha, 1 - self.hybrid_alpha)
+                yield fuse_weighted([dense_hits, lexical_hits], weights, k)
+            else:
+                yield fuse_rrf([dense_hits, lexical_hits], k)
+
+    def _hits(self, query_embeddings, k, similarity_threshold, where=None):
+        """Yield (row ids, similarities) of each query's top-k live rows above the threshold."""
+        deleted = np.fromiter(self.deleted, dtype=np.int64, count=len(self.deleted))
+        block_size = 256  # bounds the (queries x corpus) similarity block held in memory
+        if where:
+            # Filter first, then score only the matching rows (exactly; they are usually few).
+            mask = self.filters.mask(where)
+            mask[deleted] = False
+            rows = np.flatnonzero(mask)
+            matrix = self.embeddings[rows]
+            for start in range(0, len(query_embeddings), block_size):
+                for similarities in query_embeddings[start : start + block_size] @ matrix.T:
+                    top = _top_k(similarities, k, similarity_threshold)
+                    yield rows[top], similarities[top]
+            return
+
+        if self.index is not None:
+            live = None
+            if len(deleted):
+                live = np.ones(len(self.embeddings), dtype=bool)
+                live[deleted] = False
+            for ids, scores in self.index.search(self.embeddings, query_embeddings, k, mask=live):
+                keep = scores >= similarity_threshold
+                yield ids[keep], scores[keep]
+            return
+
+        if self.sharded is not None and isinstance(self.embeddings, np.memmap):
+            # The workers map the same .npy file, which upserts and compactions keep current.
+            yield from self.sharded.search(
+                self.embeddings_path,
+                len(self.embeddings),
+                query_embeddings,
+                k,
+                similarity_threshold,
+                deleted,
+            )
+            return
+
+        for start in range(0, len(query_embeddings), block_size):
+            similarities = query_embeddings[start : start + block_size] @ self.embeddings.T
+            similarities[:, deleted] = -np.inf
+            for row in similarities:
+                top = _top_k(row, k, similarity_threshold)
+                yield top, row[top]
+
+    def _sync_index(self):
+        """Load the saved index and bring it up to date with the embedding matrix."""
+        if self.index is None:
+            return
+        if not len(self.index) and os.path.exists(self.index_path):
+            self.index.load(self.index_path)
+        if len(self.index) == len(self.embeddings):
+            return
+        if len(self.index) > len(self.embeddings):
+            self.index.build(self.embeddings)
+        else:
+            self.index.add(self.embeddings, len(self.index))
+        self.index.save(self.index_path)
+
+    def _sync_lexical(self):
+        """Load the saved BM25 index and bring it up to date with the metadata."""
+        if not len(self.lexical) and os.path.exists(self.lexical_path):
+            self.lexical.load(self.lexical_path)
+        if len(self.lexical) == len(self.metadata):
+            return
+        texts = [self._format_text(item) for item in self.metadata]
+        if len(self.lexical) > len(self.metadata):
+            self.lexical.build(texts)
+        else:
+            self.lexical.add(texts, len(self.lexical))
+        self.lexical.save(self.lexical_path)
 
     def save_db(self):
-        data = {
-            "embeddings": self.embeddings,
-            "metadata": self.metadata,
-            "query_cache": json.dumps(self.query_cache),
-        }
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        with open(self.db_path, "wb") as file:
-            pickle.dump(data, file)
+        _save_matrix(self.embeddings_path, self.embeddings)
+        self._save_metadata()
+        self.query_cache.flush()
+
+    def close(self):
+        """Wait for a running compaction and stop the shard worker processes, if any."""
+        if self._compactor is not None:
+            self._compactor.join()
+        if self.sharded is not None:
+            self.sharded.close()
+
+    def _checkpoint(self):
+        """Append the rows added or refreshed since the last save to the journal.
+
+        Only those rows are written, so a checkpoint costs its own batch rather than a
+        rewrite of the whole sidecar. load_db replays the journal over the sidecar and
+        the next _save_metadata folds it in. The journal starts with the sidecar's row
+        count and generation, so one left over from before a later save is ignored.
+        """
+        rows = sorted(row for row in self._refreshed if row < self._saved_rows)
+        rows += range(self._saved_rows, len(self.metadata))
+        if not rows:
+            return
+        lines = []
+        if not os.path.exists(self.journal_path):
+            lines.append({"base": self._saved_rows, "generation": self._generation})
+        lines += [
+            {"row": row, "metadata": self.metadata[row], "hash": self.hashes[row]} for row in rows
+        ]
+        with open(self.journal_path, "a") as file:
+            file.writelines(json.dumps(line) + "\n" for line in lines)
+        self._saved_rows = len(self.metadata)
+        self._refreshed = set()
+
+    def _replay_journal(self):
+        """Apply the journal written since the sidecar was saved, if there is one."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as file:
+            lines = file.readlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, json.JSONDecodeError):
+            header = None
+        if header != {"base": len(self.metadata), "generation": self._generation}:
+            os.remove(self.journal_path)  # written before the sidecar's last save
+            return
+        live = {
+            item[self.id_field]: row
+            for row, item in enumerate(self.metadata)
+            if row not in self.deleted
+        }
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break  # the last line of a checkpoint that was interrupted
+            row, item = entry["row"], entry["metadata"]
+            if row < len(self.metadata):
+                self.metadata[row] = item
+                self.hashes[row] = entry["hash"]
+                continue
+            # An appended row tombstones the live row it replaces, as in _commit.
+            old_row = live.get(item[self.id_field])
+            if old_row is not None:
+                self.deleted.add(old_row)
+            live[item[self.id_field]] = row
+            self.metadata.append(item)
+            self.hashes.append(entry["hash"])
+
+    def _save_metadata(self):
+        tmp_path = f"{self.metadata_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {
+                    "model": self.embedder.model,
+                    "metadata": self.metadata,
+                    "hashes": self.hashes,
+                    "deleted": sorted(self.deleted),
+                    "generation": self._generation,
+                },
+                file,
+            )
+        os.replace(tmp_path, self.metadata_path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._saved_rows = len(self.metadata)
+        self._refreshed = set()
 
     def load_db(self):
+        if not os.path.exists(self.embeddings_path):
+            self._migrate_pickle()
+        with open(self.metadata_path, "r") as file:
+            data = json.load(file)
+        if data.get("model", self.embedder.model) != self.embedder.model:
+            raise ValueError(
+                f"{self.metadata_path} was embedded with {data['model']!r}, "
+                f"not {self.embedder.model!r}; use a different name for this embedder."
+            )
+        self.metadata = data["metadata"]
+        # Sidecars written before upserts existed carry no hashes or tombstones.
+        self.hashes = data.get("hashes") or [self._hash(item) for item in self.metadata]
+        self.deleted = set(data.get("deleted", []))
+        self._generation = data.get("generation", 0)
+        self._replay_journal()
+        self._saved_rows = len(self.metadata)
+        self._refreshed = set()
+        self._recover_compaction()
+        self.embeddings = _load_matrix(self.embeddings_path)
+        if len(self.embeddings) < len(self.metadata):
+            raise ValueError(
+                f"{self.embeddings_path} has {len(self.embeddings)} rows but "
+                f"{self.metadata_path} describes {len(self.metadata)}."
+            )
+        if len(self.embeddings) > len(self.metadata):
+            # Rows appended by an ingest() interrupted before its next checkpoint.
+            self.embeddings = None
+            _truncate_rows(self.embeddings_path, len(self.metadata))
+            self.embeddings = _load_matrix(self.embeddings_path)
+        self._reindex_rows()
+        if "query_cache" in data:
+            # Sidecars written before the query cache moved to its own log still embed it.
+            self.query_cache.update(data["query_cache"])
+            self.save_db()
+        self._sync_index()
+
+    def _recover_compaction(self):
+        """Finish or discard a compaction interrupted between its matrix and sidecar writes.
+
+        A compacted matrix waits under its generation's name until the sidecar records
+        that generation; then it replaces the old matrix. One matching the sidecar is
+        swapped in now and any other is left over from a compaction that never
+        committed, so it is deleted.
+        """
+        directory, prefix = os.path.split(f"{self.embeddings_path}.")
+        for name in os.listdir(directory or "."):
+            suffix = name[len(prefix) :]
+            if not name.startswith(prefix) or not suffix.isdigit():
+                continue
+            path = os.path.join(directory, name)
+            if int(suffix) == self._generation:
+                os.replace(path, self.embeddings_path)
+            else:
+                os.remove(path)
+
+    def _migrate_pickle(self):
+        """Convert a legacy pickled database into the .npy matrix plus JSON sidecar format."""
         if not os.path.exists(self.db_path):
             raise ValueError(
                 "Vector database file not found. Use load_data to create a new database."
             )
         with open(self.db_path, "rb") as file:
             data = pickle.load(file)
-        self.embeddings = data["embeddings"]
+        self.embeddings = _to_matrix(data["embeddings"])
         self.metadata = data["metadata"]
-        self.query_cache = json.loads(data["query_cache"])
+        self.hashes = [self._hash(item) for item in self.metadata]
+        self._reindex_rows()
+        self.query_cache.update(json.loads(data["query_cache"]))
+        self.save_db()
+
+
+class SummaryIndexedVectorDB(VectorDB):
+    db_filename = "summary_indexed_vector_db.pkl"
+
+    def _format_text(self, item):
+        # Embed Chunk Heading + Text + Summary Together
+        return f"{item['chunk_heading']}\n\n{item['text']}\n\n{item['summary']}"
+
+    def search(self, query, k=5, similarity_threshold=0.75, where=None, mode="dense"):
+        return super().search(
+            query, k=k, similarity_threshold=similarity_threshold, where=where, mode=mode
+        )
+
+    def search_batch(self, queries, k=5, similarity_threshold=0.75, where=None, mode="dense"):
+        return super().search_batch(
+            queries, k=k, similarity_threshold=similarity_threshold, where=where, mode=mode
+        )
+
+
+_shared_dbs = {}  # (class, source file, embedding model) -> loaded store
+_shared_locks = {}
+_shared_guard = threading.Lock()
+
+
+def load_shared(cls, name, source_path, embedder=None):
+    """The `cls` store loaded from the JSON chunks at `source_path`, built once per process.
+
+    Callers asking for the same class, source file and embedding model share one store
+    (and one in-memory matrix) whatever `name` they pass; the first caller's name picks
+    the directory it is saved under. Nothing is loaded until the first call.
+    """
+    embedder = VoyageEmbedder() if embedder is None else embedder
+    key = (cls, os.path.abspath(source_path), embedder.model)
+    with _shared_guard:
+        lock = _shared_locks.setdefault(key, threading.Lock())
+    # Per-store lock: concurrent first uses wait for one load, other stores load in parallel.
+    with lock:
+        if key not in _shared_dbs:
+            db = cls(name, embedder=embedder)
+            with open(source_path, "r") as f:
+                db.load_data(json.load(f))
+            _shared_dbs[key] = db
+    return _shared_dbs[key]
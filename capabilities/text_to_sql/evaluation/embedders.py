@@ -0,0 +1,80 @@
+"""Embedding providers that VectorDB can be built with.
+
+An embedder exposes a `model` string, which names its vector space (embeddings
+are cached under it and stores built with one model refuse to load with another),
+and `embed(texts)`, which returns one vector per text. Set `cacheable = False` for
+embedders cheaper to recompute than to look up in the shared EmbeddingCache.
+"""
+
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+import voyageai
+
+_FNV_OFFSET = np.uint64(14695981039346656037)
+_FNV_PRIME = np.uint64(1099511628211)
+
+
+class Embedder(ABC):
+    """Base class for embedders; a subclass without `embed` cannot be instantiated."""
+
+    model = None
+    cacheable = True
+
+    @abstractmethod
+    def embed(self, texts):
+        """One vector per text in `texts`, in order."""
+
+
+class VoyageEmbedder(Embedder):
+    """Embeds texts with the Voyage AI API (the key defaults to VOYAGE_API_KEY)."""
+
+    def __init__(self, model="voyage-2", api_key=None):
+        self.model = model
+        self.client = voyageai.Client(api_key=api_key or os.getenv("VOYAGE_API_KEY"))
+
+    def embed(self, texts):
+        return self.client.embed(texts, model=self.model).embeddings
+
+
+class HashingEmbedder(Embedder):
+    """Deterministic offline embedder: signed feature hashing of character n-grams.
+
+    Every lowercased character n-gram with n in `ngram_range` is hashed (FNV-1a plus a
+    64-bit finalizer, computed for all positions of a text at once with numpy) into
+    one of `dim` buckets with a hash-derived sign, so texts sharing substrings get
+    similar vectors. Output depends only on the text, `dim`, `ngram_range` and
+    `seed`, never on the process or machine, and no network access is needed, which
+    makes it suitable for CI, air-gapped machines and load tests at any corpus size.
+    """
+
+    cacheable = False
+
+    def __init__(self, dim=256, ngram_range=(3, 5), seed=0):
+        self.dim = dim
+        self.ngram_range = ngram_range
+        self.seed = seed
+        self.model = f"hashing-{dim}-{ngram_range[0]}-{ngram_range[1]}-{seed}"
+
+    def embed(self, texts):
+        return [self._embed_one(text) for text in texts]
+
+    def _embed_one(self, text):
+        codes = np.frombuffer(f" {text.lower()} ".encode(), dtype=np.uint8).astype(np.uint64)
+        vector = np.zeros(self.dim, dtype=np.float64)
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            n_grams = len(codes) - n + 1
+            if n_grams <= 0:
+                break
+            hashes = np.full(n_grams, _FNV_OFFSET ^ np.uint64(self.seed * 1_000_003 + n))
+            for offset in range(n):
+                hashes = (hashes ^ codes[offset : offset + n_grams]) * _FNV_PRIME
+            hashes ^= hashes >> np.uint64(33)
+            hashes *= np.uint64(0xFF51AFD7ED558CCD)
+            hashes ^= hashes >> np.uint64(33)
+            buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+            signs = np.where(hashes >> np.uint64(63), -1.0, 1.0)
+            vector += np.bincount(buckets, weights=signs, minlength=self.dim)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).astype(np.float32)
@@ -143,7 +143,7 @@ def generate_prompt_with_rag(context):
 
     user_query = context["vars"]["user_query"]
 
-    if not vectordb.embeddings:
+    if not len(vectordb.embeddings):
         with sqlite3.connect(DATABASE_PATH) as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
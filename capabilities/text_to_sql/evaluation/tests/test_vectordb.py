@@ -0,0 +1,114 @@
+"""
+Unit tests for the text-to-SQL VectorDB, built offline with HashingEmbedder.
+"""
+
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from embedders import HashingEmbedder
+from embedding_cache import EmbeddingCache
+from vectordb import VectorDB
+
+TABLES = ["employees", "departments", "salaries", "projects"]
+
+
+def make_items(n):
+    return [
+        {
+            "text": f"Row {i} of {TABLES[i % len(TABLES)]}: column_{i} holds value {i * 13}.",
+            "metadata": {"table": TABLES[i % len(TABLES)], "row": i},
+        }
+        for i in range(n)
+    ]
+
+
+class CountingEmbedder(HashingEmbedder):
+    """HashingEmbedder that counts the texts it embeds."""
+
+    def __init__(self, dim=128):
+        super().__init__(dim=dim)
+        self.embedded = 0
+
+    def embed(self, texts):
+        self.embedded += len(texts)
+        return super().embed(texts)
+
+
+class TestVectorDB(unittest.TestCase):
+    """Test suite for loading, persistence, search and the query log."""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.db_path = os.path.join(self.test_dir, "vector_db.pkl")
+        self.cache = EmbeddingCache(os.path.join(self.test_dir, "embeddings.sqlite3"))
+        self.items = make_items(40)
+
+    def make_db(self, embedder=None):
+        return VectorDB(
+            self.db_path,
+            embedding_cache=self.cache,
+            embedder=embedder or HashingEmbedder(dim=128),
+        )
+
+    def test_search_finds_the_row_and_returns_its_metadata(self):
+        """Test that a row's own text ranks it first, with the inner metadata."""
+        db = self.make_db()
+        db.load_data(self.items)
+        results = db.search(self.items[7]["text"], k=3, similarity_threshold=-1.0)
+        self.assertEqual(results[0]["metadata"], self.items[7]["metadata"])
+        self.assertAlmostEqual(results[0]["similarity"], 1.0, places=5)
+        self.assertEqual(len(results), 3)
+
+    def test_reopened_store_embeds_nothing(self):
+        """Test that the saved matrix, metadata and query log are reused on reopening."""
+        db = self.make_db()
+        db.load_data(self.items)
+        query = "Which employees earn the most?"
+        expected = db.search(query, k=5, similarity_threshold=-1.0)
+
+        embedder = CountingEmbedder()
+        reopened = self.make_db(embedder)
+        reopened.load_data(self.items)  # already loaded, so nothing is embedded
+        np.testing.assert_array_equal(reopened.embeddings, db.embeddings)
+        self.assertEqual(reopened.metadata, [item["metadata"] for item in self.items])
+        self.assertEqual(reopened.search(query, k=5, similarity_threshold=-1.0), expected)
+        self.assertEqual(embedder.embedded, 0)
+
+    def test_reload_with_other_embedder_raises(self):
+        """Test that a store embedded with one model refuses to load with another."""
+        self.make_db().load_data(self.items)
+        with self.assertRaises(ValueError):
+            self.make_db(HashingEmbedder(dim=64))
+
+    def test_legacy_pickle_is_migrated(self):
+        """Test that a pickled database and its embedded query cache move to the new files."""
+        embedder = HashingEmbedder(dim=128)
+        texts = [item["text"] for item in self.items]
+        query = "Total budget per department"
+        with open(self.db_path, "wb") as f:
+            pickle.dump(
+                {
+                    "embeddings": embedder.embed(texts),
+                    "metadata": [item["metadata"] for item in self.items],
+                    "query_cache": json.dumps({query: embedder.embed([query])[0].tolist()}),
+                },
+                f,
+            )
+        counting = CountingEmbedder()
+        db = self.make_db(counting)
+        self.assertTrue(os.path.exists(db.embeddings_path))
+        self.assertTrue(os.path.exists(db.query_cache_path))
+        self.assertEqual(db.search(texts[3], k=1)[0]["metadata"], self.items[3]["metadata"])
+        self.assertEqual(counting.embedded, 1)  # the row text; the legacy query was cached
+        db.search(query)
+        self.assertEqual(counting.embedded, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
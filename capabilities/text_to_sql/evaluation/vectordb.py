@@ -1,62 +1,152 @@
+import json
 import os
-import numpy as np
-import voyageai
 import pickle
-import json
+
+import numpy as np
+from embedders import VoyageEmbedder
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline
+
+
+def _to_matrix(embeddings):
+    """Stack embeddings into one contiguous float32 matrix with unit-length rows."""
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+    if matrix.size == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def _top_k(similarities, k, similarity_threshold):
+    """Indices of the k highest similarities at or above the threshold, best first."""
+    candidates = np.flatnonzero(similarities >= similarity_threshold)
+    if k <= 0:
+        return candidates[:0]
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(similarities[candidates], -k)[-k:]]
+    return candidates[np.argsort(-similarities[candidates], kind="stable")]
+
+
+def _save_matrix(path, matrix):
+    """Write a float32 matrix as a raw .npy file, atomically replacing any existing copy."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        np.save(file, np.ascontiguousarray(matrix, dtype=np.float32))
+    os.replace(tmp_path, path)
+
+
+def _load_matrix(path):
+    """Open a .npy matrix read-only through np.memmap so processes share the page cache."""
+    matrix = np.load(path, mmap_mode="r")
+    if matrix.dtype != np.float32 or matrix.ndim != 2:
+        raise ValueError(f"Expected a 2-D float32 matrix in {path}, got {matrix.dtype}.")
+    return matrix
 
 
 class VectorDB:
-    def __init__(self, db_path="../data/vector_db.pkl"):
-        self.client = voyageai.Client(api_key=os.getenv("VOYAGE_API_KEY"))
+    def __init__(
+        self,
+        db_path="../data/vector_db.pkl",
+        embedding_cache=None,
+        embedding_pipeline=None,
+        embedder=None,
+    ):
+        # Any embedder from embedders.py; Voyage (keyed by VOYAGE_API_KEY) unless one is given.
+        self.embedder = VoyageEmbedder() if embedder is None else embedder
+        # Shared with every other store, so a text is only ever embedded once per model.
+        self.embedding_cache = EmbeddingCache() if embedding_cache is None else embedding_cache
+        # Concurrency, rate limits and retries for the API calls the cache cannot answer.
+        self.embedding_pipeline = embedding_pipeline or EmbeddingPipeline()
         self.db_path = db_path
         self.load_db()
 
+    @property
+    def embeddings_path(self):
+        return os.path.splitext(self.db_path)[0] + ".npy"
+
+    @property
+    def metadata_path(self):
+        return os.path.splitext(self.db_path)[0] + ".json"
+
+    @property
+    def query_cache_path(self):
+        return os.path.splitext(self.db_path)[0] + "_query_cache.jsonl"
+
     def load_db(self):
-        if os.path.exists(self.db_path):
+        legacy_query_cache = None
+        if os.path.exists(self.embeddings_path):
+            with open(self.metadata_path, "r") as file:
+                data = json.load(file)
+            if data.get("model", self.embedder.model) != self.embedder.model:
+                raise ValueError(
+                    f"{self.metadata_path} was embedded with {data['model']!r}, "
+                    f"not {self.embedder.model!r}."
+                )
+            self.embeddings, self.metadata = _load_matrix(self.embeddings_path), data["metadata"]
+            legacy_query_cache = data.get("query_cache")
+        elif os.path.exists(self.db_path):
             with open(self.db_path, "rb") as file:
                 data = pickle.load(file)
-            self.embeddings, self.metadata, self.query_cache = (
-                data["embeddings"],
-                data["metadata"],
-                json.loads(data["query_cache"]),
-            )
+            self.embeddings, self.metadata = _to_matrix(data["embeddings"]), data["metadata"]
+            legacy_query_cache = json.loads(data["query_cache"])
         else:
-            self.embeddings, self.metadata, self.query_cache = [], [], {}
+            self.embeddings, self.metadata = np.empty((0, 0), dtype=np.float32), []
+        self.query_cache = self._load_query_cache()
+
+        if legacy_query_cache is not None:
+            # Older formats kept the query cache inside the database; move it to its own log.
+            self._append_query_cache(legacy_query_cache)
+            self.query_cache.update(legacy_query_cache)
+            self.save_db()
+
+    def _load_query_cache(self):
+        query_cache = {}
+        if os.path.exists(self.query_cache_path):
+            with open(self.query_cache_path, "r") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Skip a line torn by an interrupted write
+                    query_cache[record["query"]] = record["embedding"]
+        return query_cache
+
+    def _append_query_cache(self, entries):
+        lines = "".join(
+            json.dumps({"query": query, "embedding": embedding}) + "\n"
+            for query, embedding in entries.items()
+        )
+        with open(self.query_cache_path, "a") as file:
+            file.write(lines)
 
     def load_data(self, data):
-        if not self.embeddings:
+        if not len(self.embeddings):
             texts = [item["text"] for item in data]
-            self.embeddings = [
-                emb
-                for batch in range(0, len(texts), 128)
-                for emb in self.client.embed(
-                    texts[batch : batch + 128], model="voyage-2"
-                ).embeddings
-            ]
+            self.embeddings = _to_matrix(
+                self.embedding_cache.embed(self.embedder, texts, pipeline=self.embedding_pipeline)
+            )
             self.metadata = [item["metadata"] for item in data]  # Store only the inner metadata
             self.save_db()
 
     def search(self, query, k=5, similarity_threshold=0.3):
         if query not in self.query_cache:
-            self.query_cache[query] = self.client.embed([query], model="voyage-2").embeddings[0]
-            self.save_db()
-
-        similarities = np.dot(self.embeddings, self.query_cache[query])
-        top_indices = np.argsort(similarities)[::-1]
+            [embedding] = self.embedding_cache.embed(
+                self.embedder, [query], pipeline=self.embedding_pipeline
+            )
+            self.query_cache[query] = embedding.tolist()
+            # Append just the new query; the corpus on disk is never rewritten by a search.
+            self._append_query_cache({query: self.query_cache[query]})
 
+        similarities = self.embeddings @ _to_matrix(self.query_cache[query])[0]
         return [
-            {"metadata": self.metadata[i], "similarity": similarities[i]}
-            for i in top_indices
-            if similarities[i] >= similarity_threshold
-        ][:k]
+            {"metadata": self.metadata[i], "similarity": float(similarities[i])}
+            for i in _top_k(similarities, k, similarity_threshold)
+        ]
 
     def save_db(self):
-        with open(self.db_path, "wb") as file:
-            pickle.dump(
-                {
-                    "embeddings": self.embeddings,
-                    "metadata": self.metadata,
-                    "query_cache": json.dumps(self.query_cache),
-                },
-                file,
-            )
+        _save_matrix(self.embeddings_path, self.embeddings)
+        tmp_path = f"{self.metadata_path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"model": self.embedder.model, "metadata": self.metadata}, file)
+        os.replace(tmp_path, self.metadata_path)